@@ -4,14 +4,16 @@ import time
 
 class AcquisitionThread(threading.Thread):
 
-    def __init__(self, camera, queue):
+    def __init__(self, camera, mailbox, channel=0):
         super(AcquisitionThread, self).__init__()
         self.abort_flag = False
         self.camera = camera
-        self.queue = queue
+        self.mailbox = mailbox
+        self.channel = channel
 
     def run(self):
         while not self.abort_flag:
-            self.camera.query_frame()
-            self.queue.put(self.camera.frame, block=False)
+            frame = self.camera.grab()
+            frame.channel = self.channel
+            self.mailbox.put(frame)
             time.sleep(0)
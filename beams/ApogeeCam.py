@@ -1,3 +1,4 @@
+import time
 import numpy as N
 import win32com.client
 # generate and import apogee ActiveX module
@@ -23,6 +24,8 @@ class ApogeeCam(Camera):
         'copyright year': '2011',
     }
 
+    hardware_roi = True
+
     camera_num2 = Int(0)
     camera_model = Str()
     driver_version = Str()
@@ -47,12 +50,12 @@ class ApogeeCam(Camera):
         self._reverse_constants = dict((v, k)
             for k, v in self._interface_constants.iteritems())
 
-        self._buffer = None
+        self._buffer_shape = None
 
     def open(self):
         self._cam.Init(self._interface_constants[self.interface],
             self.camera_number, self.camera_num2, 0)
-        self._buffer = N.zeros(self.roi[-1:-3:-1], dtype=N.uint16)
+        self._buffer_shape = self.roi[-1:-3:-1]
 
     def close(self):
         self._cam.Close()
@@ -67,15 +70,22 @@ class ApogeeCam(Camera):
             expose_time = self.expose_time
         if open_shutter is None:
             open_shutter = self.open_shutter
+        buffer = self._get_buffer(self._buffer_shape, N.uint16)
         try:
             self._cam.Expose(expose_time, open_shutter)
             while self._cam.ImagingStatus != Constants.Apn_Status_ImageReady:
-                pass
-            self._cam.GetImage(self._buffer.ctypes.data)
+                time.sleep(0)  # let other threads run while we wait
+            self._cam.GetImage(buffer.ctypes.data)
+        except:
+            self._release_buffer(buffer)
+            raise
         finally:
             if self._cam.ImagingStatus < 0:
                 self.reset()
-        self.frame = N.copy(self._buffer)
+        self.frame = buffer
+
+    def get_exposure(self):
+        return self.expose_time
 
     def choose_camera(self):
         discover = win32com.client.Dispatch('Apogee.CamDiscover')
@@ -119,4 +129,4 @@ class ApogeeCam(Camera):
         self._cam.RoiStartY = y
         self._cam.RoiPixelsH = w
         self._cam.RoiPixelsV = h
-        self._buffer = N.zeros((h, w), dtype=N.uint16)
+        self._buffer_shape = (h, w)
@@ -1,34 +1,142 @@
 #coding: utf8
 import numpy as N
-from traits.api import Button
+from traits.api import Button, Range, Enum, Bool, Str, Instance
 from traitsui.api import View, VGroup, Item
+from DarkLibrary import DarkLibrary
 from TransformPlugin import TransformPlugin
 
 
 class BackgroundSubtract(TransformPlugin):
 
     capture_background = Button()
+    # The background is the mean or median of this many frames
+    num_frames = Range(1, 100, 10)
+    method = Enum('mean', 'median')
+    # Keep backgrounds on disk for each camera, resolution and exposure time
+    use_library = Bool(True)
+    status = Str()
+    library = Instance(DarkLibrary)
+
+    in_place = True
 
     view = View(
         VGroup(
             Item('active'),
+            Item('num_frames', label='Average # frames'),
+            Item('method'),
+            Item('use_library', label='Remember backgrounds'),
             Item('capture_background', show_label=False),
+            Item('status', style='readonly', show_label=False),
             label='Background Subtract',
             show_border=True))
 
     def __init__(self, **traits):
         super(BackgroundSubtract, self).__init__(**traits)
-        self._background_frame = None
-        self._capture_next_frame = True
+        self._settings = None  # camera, shape and exposure of the background
+        self._background = None  # float32
+        self._applied = None  # background in the frames' own data type
+        self._captured = None  # frames captured so far, or their mean
+        self._difference = None
+        self._num_captured = 0
+        self._capture_median = False
+        self._capture_next_frame = False
+
+    def _library_default(self):
+        return DarkLibrary()
 
-    def _process(self, frame):
+    def _process(self, frame, out):
+        info = self.current_frame
+        settings = (info.source, frame.shape, info.exposure)
+        if settings != self._settings:
+            # Different camera settings need a different background
+            self._settings = settings
+            self._set_background(self.library.get(*settings)
+                if self.use_library else None)
+            if self._background is None:
+                self._capture_next_frame = True
+            else:
+                self.status = 'Background from library'
         if self._capture_next_frame:
-            self._background_frame = frame
-            self._capture_next_frame = False
-        temp = N.asfarray(frame) - self._background_frame
+            self._start_capture(frame)
+        if self._captured is not None:
+            self._capture(frame)
+        if self._background is None:
+            return frame
+
+        if self._applied is None or self._applied.dtype != frame.dtype:
+            # Round once here, instead of subtracting in floating point for
+            # every frame
+            self._applied = _to_dtype(self._background, frame.dtype)
+        if out is None:
+            out = self._get_output(frame.shape, frame.dtype)
         if frame.dtype.kind == 'u':
-            temp[temp < 0] = 0.0
-        return N.asarray(temp, dtype=frame.dtype)
+            # Subtract, clipping at 0, without leaving the unsigned type:
+            # max(frame, background) - background
+            N.maximum(frame, self._applied, out=out)
+            out -= self._applied
+        else:
+            N.subtract(frame, self._applied, out=out)
+        return out
+
+    def _set_background(self, background):
+        self._background = background
+        self._applied = None
+
+    def _start_capture(self, frame):
+        self._capture_next_frame = False
+        self._num_captured = 0
+        self._capture_median = (self.method == 'median')
+        if self._capture_median:
+            # The median needs all the frames
+            self._captured = N.empty((self.num_frames,) + frame.shape,
+                dtype=frame.dtype)
+        else:
+            self._captured = N.zeros(frame.shape, dtype=N.float32)
+            self._difference = N.empty(frame.shape, dtype=N.float32)
+
+    def _capture(self, frame):
+        captured = self._captured
+        if captured.shape[-frame.ndim:] != frame.shape:
+            # Camera settings changed halfway through
+            self._start_capture(frame)
+            captured = self._captured
+        if self._capture_median:
+            captured[self._num_captured] = frame
+            self._num_captured += 1
+        else:
+            # Running mean: mean += (frame - mean) / n
+            self._num_captured += 1
+            N.subtract(frame, captured, out=self._difference)
+            self._difference /= self._num_captured
+            captured += self._difference
+        self.status = 'Capturing background: {} of {}'.format(
+            self._num_captured, self.num_frames)
+        if self._num_captured < self.num_frames:
+            return
+
+        if self._capture_median:
+            background = N.median(captured, axis=0).astype(N.float32)
+        else:
+            background = captured
+        self._captured = self._difference = None
+        self._set_background(background)
+        self.status = 'Background of {} frames'.format(self.num_frames)
+        if self.use_library:
+            try:
+                self.library.put(self._settings[0], self._settings[1],
+                    self._settings[2], background)
+            except (IOError, OSError) as e:
+                self.status += ' (not saved: {})'.format(e)
 
     def _capture_background_fired(self):
         self._capture_next_frame = True
+
+
+def _to_dtype(background, dtype):
+    """Converts a float32 background to @dtype, rounding and clipping"""
+    dtype = N.dtype(dtype)
+    if dtype.kind in 'ui':
+        limits = N.iinfo(dtype)
+        return N.clip(N.rint(background), limits.min, limits.max).astype(
+            dtype)
+    return background.astype(dtype)
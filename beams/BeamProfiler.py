@@ -1,9 +1,20 @@
 #coding: utf8
 import numpy as N
-from traits.api import Int, Float, Tuple, Range
+from traits.api import Int, Float, Tuple, Range, Enum, Bool
 from traitsui.api import View, VGroup, Item
 from enable.api import ColorTrait
-from DisplayPlugin import DisplayPlugin
+from DisplayPlugin import (DisplayPlugin, SCHEDULE_GROUP, SCHEDULES,
+    FIXED_RATE)
+from GaussianFit import (second_moments, fit_gaussian, fit_binned,
+    AMPLITUDE, X0, Y0, SIGMA_A, SIGMA_B, ANGLE, OFFSET)
+from Moments import calculate_moments
+from Percentile import percentile
+
+
+FIT_BINNING = 4  # first fit on blocks of this many pixels squared
+# Bin large beams when refining the fit, so that at most this many points
+# are fitted; with beams that large, binning hardly changes the result
+MAX_FIT_POINTS = 1 << 16
 
 
 class BeamProfiler(DisplayPlugin):
@@ -12,6 +23,18 @@ class BeamProfiler(DisplayPlugin):
     background_percentile = Range(0.0, 100.0, 15.0)
     num_crops = Range(0, 5, 1)
     crop_radius = Range(1.0, 4.0, 1.5)  # in beam diameters
+    # Start each frame from a window around the beam in the previous frame,
+    # and only search the whole frame when the beam is lost, i.e. when its
+    # total intensity or size changes by more than this fraction
+    tracking = Bool(False)
+    lost_threshold = Range(0.05, 1.0, 0.5)
+    # Fit a Gaussian to the beam, instead of taking the Gaussian with the
+    # same moments. Each frame's fit starts from the previous one, unless
+    # the beam has changed by more than the lost threshold.
+    gaussian_fit = Bool(False)
+
+    # The profile is expensive; by default analyze five frames per second
+    schedule = Enum(FIXED_RATE, SCHEDULES)
 
     # These are the results of the calculation
     _centroid = Tuple(Float(), Float())
@@ -21,6 +44,8 @@ class BeamProfiler(DisplayPlugin):
     _ellipticity = Float()
     _baseline = Float()
     _include_radius = Float()
+    _tracked = Bool()  # whether the beam was found near the previous one
+    _fitted = Bool()  # whether the Gaussian fit succeeded
 
     # These control the visualization
     num_points = Int(40)
@@ -32,11 +57,19 @@ class BeamProfiler(DisplayPlugin):
             Item('background_percentile'),
             Item('num_crops', label='Crop # times'),
             Item('crop_radius'),
+            Item('tracking', label='Track beam'),
+            Item('lost_threshold', enabled_when='tracking or gaussian_fit'),
+            Item('gaussian_fit'),
+            SCHEDULE_GROUP,
             label='Beam Profiler',
             show_border=True))
 
     def __init__(self, **traits):
+        self._last_beam = None  # frame shape and moments, when tracking
+        self._last_fit = None  # frame shape and fit parameters
         super(BeamProfiler, self).__init__(**traits)
+        if self.screen is None:
+            return  # nothing to draw on
         self.screen.data_store['centroid_x'] = N.array([])
         self.screen.data_store['centroid_y'] = N.array([])
         self.screen.data_store['ellipse_x'] = N.array([])
@@ -60,7 +93,7 @@ class BeamProfiler(DisplayPlugin):
             '_centroid,_width,_height,_angle', dispatch='ui')
         self.on_trait_change(self._update_hud,
             '_centroid,_width,_height,_angle,_ellipticity,_baseline,'
-            '_include_radius',
+            '_include_radius,_tracked,_fitted',
             dispatch='ui')
 
     def _move_centroid(self):
@@ -90,52 +123,196 @@ class BeamProfiler(DisplayPlugin):
             u'Rotation: {0._angle:.1f}°\n'
             'Ellipticity: {0._ellipticity:.3f}\n'
             'Baseline: {0._baseline:.1f}\n'
-            'Inclusion radius: {0._include_radius:.1f}'.format(self))
+            'Inclusion radius: {0._include_radius:.1f}'.format(self)
+            + ('\nTracking: ' + ('locked' if self._tracked else 'searching')
+                if self.tracking else '')
+            + ('\nGaussian fit: ' + ('ok' if self._fitted else 'failed')
+                if self.gaussian_fit else ''))
+
+    def _tracking_changed(self):
+        self._last_beam = None
+
+    def _gaussian_fit_changed(self):
+        self._last_fit = None
+
+    def _process(self, context):
+        # The image is shared with other plugins, so the background is not
+        # subtracted from it, but taken into account in the moments
+        if context.is_monochrome:
+            frame = context.data
+        else:
+            frame = context.gray
+
+        beam = None
+        if self.tracking and self._last_beam is not None:
+            beam = self._track(frame)
+        self._tracked = beam is not None
+        if beam is None:
+            # Search the whole frame. Calibrate the background, using the
+            # histogram that is shared with other plugins if the frame has one
+            background = percentile(frame, self.background_percentile,
+                context.histogram)
+            moments = calculate_moments(frame, background,
+                (context.column_projection, context.row_projection))
+            beam = self._refine(frame, background, moments, 0, 0, 0.0)
+
+        background, include_radius, moments = beam
+        m00, m10, m01, m20, m02, m11 = moments
+        if self.tracking:
+            self._last_beam = (frame.shape,) + moments
+
+        params = None
+        if self.gaussian_fit:
+            params, include_radius = self._fit(frame, include_radius)
+        self._fitted = params is not None
+
+        if params is not None:
+            # The 1/e^2 diameters of the fitted Gaussian
+            self._major_axis = 4 * params[SIGMA_A]
+            self._minor_axis = 4 * params[SIGMA_B]
+            self._angle = N.degrees(params[ANGLE])
+            m10, m01 = params[X0], params[Y0]
+            background = params[OFFSET]
+        else:
+            # Calculate Gaussian boundary
+            q = N.sqrt((m20 - m02) ** 2 + 4 * m11 ** 2)
+            self._major_axis = 2 ** 1.5 * N.sqrt(m20 + m02 + q)
+            self._minor_axis = 2 ** 1.5 * N.sqrt(m20 + m02 - q)
+            self._angle = N.degrees(0.5 * N.arctan2(2 * m11, m20 - m02))
+        self._ellipticity = self._minor_axis / self._major_axis
+
+        self._centroid = (m10, m01)
+        self._baseline = background
+        self._include_radius = include_radius
+
+    def _track(self, frame):
+        """
+        Looks for the beam in a window around where it was in the previous
+        frame. Returns None if it is not there, otherwise the same as
+        _refine().
+        """
+        shape, m00, m10, m01, m20, m02, m11 = self._last_beam
+        if shape != frame.shape:
+            return None
+        include_radius, lc, bc, rc, tc, window = _crop(frame,
+            self.crop_radius, m00, m10, m01, m20, m02, m11)
+        if window.size == 0:
+            return None
+        background = percentile(window, self.background_percentile)
+        moments = calculate_moments(window, background)
+        if self._is_lost(moments):
+            return None
+        return self._refine(window, background, moments, lc, bc,
+            include_radius)
 
-    def _process(self, frame):
-        bw = (len(frame.shape) == 2)
-        if not bw:
-            # Use standard NTSC conversion formula
-            frame = N.array(
-                0.2989 * frame[..., 0]
-                + 0.5870 * frame[..., 1]
-                + 0.1140 * frame[..., 2])
+    def _is_lost(self, moments):
+        """Whether @moments are too different from the last beam's"""
+        m00, m10, m01, m20, m02, m11 = moments
+        if m00 <= 0 or m20 <= 0 or m02 <= 0:
+            return True
+        shape, last_m00, _, _, last_m20, last_m02, _ = self._last_beam
+        return (_has_changed(m00, last_m00, self.lost_threshold)
+            or _has_changed(N.sqrt(m20 + m02), N.sqrt(last_m20 + last_m02),
+                self.lost_threshold))
 
-        # Calibrate the background
-        background = N.percentile(frame, self.background_percentile)
-        frame -= background
-        #N.clip(frame, 0.0, frame.max(), out=frame)
+    def _fit(self, frame, include_radius):
+        """
+        Fits a Gaussian to the beam, starting from the previous frame's fit.
+        If there is none, or the beam has moved away from it, the first
+        guess comes from a binned image of the whole frame. Returns the
+        parameters (None if the fit failed) and the inclusion radius of the
+        window that was fitted.
+        """
+        params = None
+        if self._last_fit is not None and self._last_fit[0] == frame.shape:
+            last = self._last_fit[1]
+            params = last
+            # Get close on a binned image of a wide area around the beam
+            # first, if it is large enough to be a few pixels wide there
+            if min(last[SIGMA_A], last[SIGMA_B]) >= FIT_BINNING:
+                window, lc, bc, radius = _fit_window(frame, last,
+                    2 * self.crop_radius)
+                params = fit_binned(window, last, FIT_BINNING, lc, bc)
+            params = self._refine_fit(frame, params)
+            if params is not None and self._fit_is_lost(params, last):
+                params = None
+        if params is None:
+            params = self._refine_fit(frame,
+                fit_binned(frame, None, FIT_BINNING))
 
-        m00, m10, m01, m20, m02, m11 = _calculate_moments(frame)
+        self._last_fit = None if params is None else (frame.shape, params)
+        if params is None:
+            return None, include_radius
+        return params, _fit_window(frame, params, self.crop_radius)[3]
 
-        bc, lc = 0, 0
+    def _refine_fit(self, frame, params):
+        # Fit on the full resolution pixels around the beam
+        if params is None:
+            return None
+        window, lc, bc, radius = _fit_window(frame, params, self.crop_radius)
+        factor = int(N.ceil(N.sqrt(window.size / float(MAX_FIT_POINTS))))
+        if factor > 1:
+            params = fit_binned(window, params, factor, lc, bc)
+        else:
+            params = fit_gaussian(window, params, lc, bc)
+        if params is None or not _is_inside(params, frame.shape):
+            return None
+        return params
+
+    def _fit_is_lost(self, params, last):
+        """Whether the fit @params is too different from the @last one"""
+        def volume(params):
+            return params[AMPLITUDE] * params[SIGMA_A] * params[SIGMA_B]
+
+        def size(params):
+            return N.hypot(params[SIGMA_A], params[SIGMA_B])
+
+        return (_has_changed(volume(params), volume(last),
+                self.lost_threshold)
+            or _has_changed(size(params), size(last), self.lost_threshold))
+
+    def _refine(self, frame, background, moments, lc, bc, include_radius):
+        """
+        Crops @frame around the beam @num_crops times, recalculating the
+        background and @moments each time. @frame starts at column @lc and
+        row @bc of the camera frame. Returns the background, the inclusion
+        radius and the moments, with the centroid in camera frame
+        coordinates.
+        """
+        m00, m10, m01, m20, m02, m11 = moments
         for count in range(self.num_crops):
-            include_radius, dlc, dbc, drc, dtc, frame = _crop(frame,
+            include_radius, dlc, dbc, drc, dtc, window = _crop(frame,
                 self.crop_radius, m00, m10, m01, m20, m02, m11)
             lc += dlc
             bc += dbc
+            if window.shape == frame.shape:
+                # The crop has converged (or covers the whole frame), so the
+                # background and the moments are the same as before
+                break
+            frame = window
 
             # Recalibrate the background and recalculate the moments
-            new_bkg = N.percentile(frame, self.background_percentile)
-            frame -= new_bkg
-            background += new_bkg
-            #N.clip(frame, 0.0, frame.max(), out=frame)
+            background = percentile(frame, self.background_percentile)
 
-            m00, m10, m01, m20, m02, m11 = _calculate_moments(frame)
+            m00, m10, m01, m20, m02, m11 = calculate_moments(frame,
+                background)
 
-        m10 += lc
-        m01 += bc
+        return (background, include_radius,
+            (m00, m10 + lc, m01 + bc, m20, m02, m11))
 
-        # Calculate Gaussian boundary
-        q = N.sqrt((m20 - m02) ** 2 + 4 * m11 ** 2)
-        self._major_axis = 2 ** 1.5 * N.sqrt(m20 + m02 + q)
-        self._minor_axis = 2 ** 1.5 * N.sqrt(m20 + m02 - q)
-        self._angle = N.degrees(0.5 * N.arctan2(2 * m11, m20 - m02))
-        self._ellipticity = self._minor_axis / self._major_axis
-
-        self._centroid = (m10, m01)
-        self._baseline = background
-        self._include_radius = include_radius
+    def results(self):
+        return {
+            'centroid_x': float(self._centroid[0]),
+            'centroid_y': float(self._centroid[1]),
+            'major_axis': float(self._major_axis),
+            'minor_axis': float(self._minor_axis),
+            'angle': float(self._angle),
+            'ellipticity': float(self._ellipticity),
+            'baseline': float(self._baseline),
+            'include_radius': float(self._include_radius),
+            'tracked': float(self._tracked),
+            'fitted': float(self._fitted),
+        }
 
     def activate(self):
         self._centroid_patch.visible = self._ellipse_patch.visible = True
@@ -147,16 +324,30 @@ class BeamProfiler(DisplayPlugin):
 
 def _calculate_moments(frame):
     """Calculate the moments"""
-    # From Bullseye
-    y, x = N.mgrid[:frame.shape[0], :frame.shape[1]]
-    m00 = frame.sum() or 1.0
-    m10 = (frame * x).sum() / m00
-    m01 = (frame * y).sum() / m00
-    dx, dy = x - m10, y - m01
-    m20 = (frame * dx ** 2).sum() / m00
-    m02 = (frame * dy ** 2).sum() / m00
-    m11 = (frame * dx * dy).sum() / m00
-    return m00, m10, m01, m20, m02, m11
+    return calculate_moments(frame)
+
+
+def _fit_window(frame, params, crop_radius):
+    """
+    Returns the part of @frame around the Gaussian @params, the column and
+    row where it starts, and its inclusion radius
+    """
+    include_radius, lc, bc, rc, tc, window = _crop(frame, crop_radius, 0.0,
+        params[X0], params[Y0], *second_moments(params))
+    return window, lc, bc, include_radius
+
+
+def _is_inside(params, shape):
+    """Whether the Gaussian @params is centered in a frame of @shape"""
+    height, width = shape
+    return (0 <= params[X0] < width and 0 <= params[Y0] < height
+        and params[SIGMA_A] < max(shape) and params[SIGMA_B] > 0
+        and params[AMPLITUDE] > 0)
+
+
+def _has_changed(value, last, threshold):
+    """Whether @value differs from @last by more than a fraction @threshold"""
+    return abs(value - last) > threshold * abs(last)
 
 
 def _crop(frame, crop_radius, m00, m10, m01, m20, m02, m11):
@@ -1,6 +1,13 @@
-from traits.api import HasTraits, Int, Str, Tuple, Array, Range
+import time
+import numpy as N
+from traits.api import (HasTraits, Int, Str, Tuple, Array, Range, Instance,
+    Any)
 from traitsui.api import View, Label
 
+from FramePool import FramePool
+from Frame import Frame, clock
+from Timing import get_histogram
+
 class CameraError(Exception):
     def __init__(self, msg, cam):
         self.msg = msg
@@ -14,10 +21,29 @@ class Camera(HasTraits):
     camera_number = Int(-1)
     id_string = Str()
     resolution = Tuple(Int(), Int())
+    # Region of interest (x, y, width, height); a width or height of 0 means
+    # the whole frame
     roi = Tuple(Int(), Int(), Int(), Int())
+    # Average each N x N block of pixels into one
+    binning = Range(1, 16, 1)
     frame_rate = Range(1, 500, 30)
     frame = Array()
 
+    # If set, drivers fill buffers from this pool instead of allocating
+    frame_pool = Instance(FramePool, transient=True)
+
+    # Drivers that apply the ROI in the camera itself set this to True;
+    # otherwise grab() crops the frames
+    hardware_roi = False
+
+    # Sequence number of the last frame returned by grab()
+    _sequence = Int(0)
+    # When the next frame is due, for drivers that pace frames themselves
+    _frame_deadline = Any()
+    # Buffers for binned frames, and the sum that is binned into
+    _binning_pool = Instance(FramePool, transient=True)
+    _binning_sum = Any(transient=True)
+
     # Default configuration panel
     view = View(Label('No settings to configure'))
 
@@ -38,6 +64,36 @@ class Camera(HasTraits):
     def query_frame(self):
         raise NotImplementedError()
 
+    def grab(self):
+        '''
+        Queries a frame and returns it as a Frame, stamped with a sequence
+        number, the capture time and the camera settings. The frame is
+        cropped to the ROI (as a view, unless the camera does that itself)
+        and binned.
+        '''
+        start = clock()
+        self.query_frame()
+        timestamp = clock()
+        get_histogram('query_frame').add(timestamp - start)
+        self._sequence += 1
+
+        buffer, pool = self.frame, self.frame_pool
+        data = buffer if self.hardware_roi else self._crop_to_roi(buffer)
+        if self.binning > 1:
+            data = buffer = self._bin(data)
+            self._release_buffer(self.frame)
+            pool = self._binning_pool
+
+        return Frame(data, sequence=self._sequence, timestamp=timestamp,
+            exposure=self.get_exposure(), roi=self.roi,
+            source=self.id_string, pool=pool, buffer=buffer)
+
+    def get_exposure(self):
+        '''
+        Returns the exposure time in seconds, or None if it is not known.
+        '''
+        return None
+
     def find_resolutions(self):
         '''
         Returns a list of resolution tuples that this camera supports.
@@ -48,3 +104,74 @@ class Camera(HasTraits):
     def configure(self):
         """Opens a dialog to set the camera's parameters."""
         pass
+
+    def _get_buffer(self, shape, dtype):
+        """
+        Returns an array for the driver to write the next frame into. Taken
+        from the frame pool if there is one, otherwise newly allocated.
+        """
+        if self.frame_pool is None:
+            return N.empty(shape, dtype=dtype)
+        return self.frame_pool.acquire(shape, dtype)
+
+    def _wait_for_next_frame(self):
+        """
+        For drivers that simulate a frame rate: sleeps until the next frame
+        is due. The deadline advances by one frame period each time, so the
+        time spent producing a frame doesn't slow down the frame rate.
+        """
+        period = 1.0 / self.frame_rate
+        now = clock()
+        if self._frame_deadline is None or now > self._frame_deadline + period:
+            # First frame, or we fell behind; don't try to catch up
+            self._frame_deadline = now
+        self._frame_deadline += period
+        delay = self._frame_deadline - clock()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _crop_to_roi(self, frame):
+        x, y, width, height = self.roi
+        if width <= 0 and height <= 0 and x <= 0 and y <= 0:
+            return frame
+        if width <= 0:
+            width = frame.shape[1]
+        if height <= 0:
+            height = frame.shape[0]
+        return frame[max(y, 0):y + height, max(x, 0):x + width]
+
+    def _bin(self, frame):
+        '''
+        Averages blocks of binning x binning pixels. Leftover rows and
+        columns at the edges are discarded.
+        '''
+        n = self.binning
+        height, width = frame.shape[0] // n, frame.shape[1] // n
+        blocks = frame[:height * n, :width * n].reshape(
+            (height, n, width, n) + frame.shape[2:])
+        shape = (height, width) + frame.shape[2:]
+        if frame.dtype.kind in 'ui' and frame.dtype.itemsize <= 2:
+            sum_dtype = N.dtype(N.int32 if frame.dtype.kind == 'i' else N.uint32)
+        else:
+            sum_dtype = N.dtype(N.float64)
+        total = self._binning_sum
+        if total is None or total.shape != shape or total.dtype != sum_dtype:
+            total = self._binning_sum = N.empty(shape, dtype=sum_dtype)
+        blocks.sum(axis=(1, 3), dtype=sum_dtype, out=total)
+
+        if self.frame_pool is None:
+            binned = N.empty(shape, dtype=frame.dtype)
+        else:
+            if self._binning_pool is None:
+                self._binning_pool = FramePool(size=self.frame_pool.size)
+            binned = self._binning_pool.acquire(shape, frame.dtype)
+        if sum_dtype.kind == 'f':
+            N.divide(total, n * n, out=binned, casting='unsafe')
+        else:
+            N.floor_divide(total, n * n, out=binned, casting='unsafe')
+        return binned
+
+    def _release_buffer(self, buffer):
+        """Hands back a buffer from _get_buffer() that was not used."""
+        if self.frame_pool is not None:
+            self.frame_pool.release(buffer)
@@ -0,0 +1,70 @@
+from traits.api import (HasTraits, Int, Instance, DelegatesTo, List, Any)
+from traitsui.api import View, VGroup, HGroup, Item, ListEditor
+
+from Camera import Camera
+from CameraImage import CameraImage
+from DisplayPlugin import DisplayPlugin
+from FramePool import FramePool
+from TransformPlugin import TransformPlugin
+from Schedule import Schedule
+
+TRANSFORM_PLUGINS = ['Rotator', 'BackgroundSubtract']
+DISPLAY_PLUGINS = ['BeamProfiler', 'MinMaxDisplay', 'DeltaDetector',
+    'Centroid', 'MultiSpot', 'PointingStability', 'VibrationSpectrum']
+FRAME_POOL_SIZE = 8  # frame buffers shared by a camera and the pipeline
+
+
+def load_plugins(names, **traits):
+    """Creates one plugin object of each class in @names"""
+    plugins = []
+    for name in names:
+        module = __import__(name, globals(), locals(), [name])
+        plugins.append(getattr(module, name)(**traits))
+    return plugins
+
+
+class CameraChannel(HasTraits):
+    """
+    A camera that is acquired at the same time as the main window's camera.
+    It has its own screen and its own transform and analysis plugins, so its
+    results are kept apart from those of the other cameras.
+    """
+
+    channel = Int()  # number that the frames of this camera are tagged with
+    camera = Instance(Camera)
+    id_string = DelegatesTo('camera')
+    screen = Instance(CameraImage, args=())
+    transform_plugins = List(Instance(TransformPlugin))
+    display_plugins = List(Instance(DisplayPlugin))
+    frame_pool = Instance(FramePool, kw={'size': FRAME_POOL_SIZE})
+    display_schedule = Instance(Schedule, ())  # when to update the screen
+    acquisition_thread = Any()  # default: None
+
+    view = View(
+        HGroup(
+            VGroup(
+                Item('id_string', style='readonly', label='Camera'),
+                Item('camera', show_label=False, style='custom'),
+                Item('transform_plugins', show_label=False,
+                    editor=ListEditor(style='custom', mutable=False)),
+                Item('display_plugins', show_label=False,
+                    editor=ListEditor(style='custom', mutable=False))),
+            Item('screen', show_label=False, width=320, height=240,
+                style='custom')))
+
+    def _transform_plugins_default(self):
+        return load_plugins(TRANSFORM_PLUGINS)
+
+    def _display_plugins_default(self):
+        return load_plugins(DISPLAY_PLUGINS, screen=self.screen)
+
+    def _camera_changed(self, value):
+        value.frame_pool = self.frame_pool
+
+    def stop(self):
+        """Stops acquisition and closes the camera."""
+        if self.acquisition_thread is not None:
+            self.acquisition_thread.abort_flag = True
+            self.acquisition_thread.join()
+            self.acquisition_thread = None
+        self.camera.close()
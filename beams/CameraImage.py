@@ -1,11 +1,13 @@
 import numpy as N
-from traits.api import (HasTraits, Array, Range, Instance, Enum)
+from traits.api import (HasTraits, Array, Range, Instance, Enum, Float)
 from traitsui.api import View, Item
 from chaco.api import (ArrayPlotData, Plot, PlotLabel, ColorMapper, gray, pink,
     jet)
 from chaco.default_colormaps import fix
 from enable.api import ComponentEditor
 from AwesomeColorMaps import awesome, isoluminant
+from Frame import Frame, clock
+from Timing import get_histogram
 
 
 def bone(rng, **traits):
@@ -24,6 +26,10 @@ def bone(rng, **traits):
 class CameraImage(HasTraits):
 
     data = Array()
+    # Setting a Frame displays its data and measures its latency
+    frame = Instance(Frame)
+    # Time from capture to display of the last frame, in seconds
+    latency = Float(0.0)
     data_store = Instance(ArrayPlotData)
     plot = Instance(Plot)
     hud_overlay = Instance(PlotLabel)
@@ -59,7 +65,12 @@ class CameraImage(HasTraits):
     def _data_default(self):
         return N.zeros(self._dims, dtype=N.uint8)
 
+    def _frame_changed(self, value):
+        self.data = value.data
+        self.latency = clock() - value.timestamp
+
     def _data_changed(self, value):
+        start = clock()
         bw = (len(value.shape) == 2)
         if not bw and self.cmap is not None:
             # Selecting a colormap coerces the image to monochrome
@@ -82,6 +93,7 @@ class CameraImage(HasTraits):
 
         # Make sure the aspect ratio is correct, even after resize
         self.plot.aspect_ratio = float(self._dims[1]) / self._dims[0]
+        get_histogram('screen update').add(clock() - start)
 
     def _get_cmap_function(self):
         return fix(
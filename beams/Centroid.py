@@ -1,8 +1,10 @@
 import numpy as N
-from traits.api import Float, Tuple
+from traits.api import Float, Tuple, Enum
 from traitsui.api import View, VGroup, Item
 from enable.api import ColorTrait
-from DisplayPlugin import DisplayPlugin
+from DisplayPlugin import (DisplayPlugin, SCHEDULE_GROUP, SCHEDULES,
+    EVERY_FRAME)
+from Moments import projections, centroid_from_projections
 
 
 class Centroid(DisplayPlugin):
@@ -10,17 +12,23 @@ class Centroid(DisplayPlugin):
     # These are the results of the calculation
     _centroid = Tuple(Float(), Float())
 
+    # Cheap enough to keep up with the camera
+    schedule = Enum(EVERY_FRAME, SCHEDULES)
+
     # These control the visualization
     color = ColorTrait('white')
 
     view = View(
         VGroup(
             Item('active'),
+            SCHEDULE_GROUP,
             label='Centroid',
             show_border=True))
 
     def __init__(self, **traits):
         super(Centroid, self).__init__(**traits)
+        if self.screen is None:
+            return  # nothing to draw on
         self.screen.data_store['centroid_x'] = N.array([])
         self.screen.data_store['centroid_y'] = N.array([])
         renderers = self.screen.plot.plot(('centroid_x', 'centroid_y'),
@@ -43,16 +51,16 @@ class Centroid(DisplayPlugin):
         self.screen.hud('centroid',
             'Centroid: {0[0]:.1f}, {0[1]:.1f}\n'.format(self._centroid))
 
-    def _process(self, frame):
-        bw = (len(frame.shape) == 2)
-        if not bw:
-            # Use standard NTSC conversion formula
-            frame = N.array(
-                0.2989 * frame[..., 0]
-                + 0.5870 * frame[..., 1]
-                + 0.1140 * frame[..., 2])
+    def _process(self, context):
+        # The projections are shared with the other plugins
+        self._centroid = centroid_from_projections(context.column_projection,
+            context.row_projection)
 
-        self._centroid = _calculate_centroid(frame)
+    def results(self):
+        return {
+            'centroid_x': float(self._centroid[0]),
+            'centroid_y': float(self._centroid[1]),
+        }
 
     def activate(self):
         self._centroid_patch.visible = True
@@ -64,9 +72,4 @@ class Centroid(DisplayPlugin):
 
 def _calculate_centroid(frame):
     """Calculate the centroid"""
-    # From Bullseye
-    y, x = N.mgrid[:frame.shape[0], :frame.shape[1]]
-    m00 = frame.sum() or 1.0
-    m10 = (frame * x).sum() / m00
-    m01 = (frame * y).sum() / m00
-    return m10, m01
+    return centroid_from_projections(*projections(frame))
@@ -0,0 +1,73 @@
+import os
+import os.path
+import re
+import tempfile
+import numpy as N
+import xdg.BaseDirectory
+
+
+def default_path():
+    return os.path.join(xdg.BaseDirectory.xdg_cache_home, 'beams', 'darks')
+
+
+class DarkLibrary(object):
+    """
+    Background (dark) frames kept on disk, so that they don't have to be
+    captured again every time the program starts. A dark frame is stored for
+    each combination of camera, frame shape and exposure time, as a float32
+    .npy file in @path. The files are memory-mapped when the library is
+    created, so they are only read when they are used.
+    """
+
+    def __init__(self, path=None):
+        self.path = default_path() if path is None else path
+        self._darks = {}
+        if not os.path.isdir(self.path):
+            return
+        for filename in os.listdir(self.path):
+            name, ext = os.path.splitext(filename)
+            if ext != '.npy':
+                continue
+            try:
+                self._darks[name] = N.load(
+                    os.path.join(self.path, filename), mmap_mode='r')
+            except (IOError, ValueError):
+                pass  # not a dark frame, or a damaged one
+
+    def get(self, source, shape, exposure):
+        """
+        Returns the dark frame for camera @source with frames of @shape at
+        @exposure seconds, or None if there is none.
+        """
+        dark = self._darks.get(_name(source, shape, exposure))
+        if dark is None or dark.shape != tuple(shape):
+            return None
+        return dark
+
+    def put(self, source, shape, exposure, dark):
+        """Stores @dark as the dark frame for these settings."""
+        name = _name(source, shape, exposure)
+        dark = N.asarray(dark, dtype=N.float32)
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        # Write to a temporary file first, so that a file that another
+        # library has mapped is never half written
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.path)
+        with os.fdopen(fd, 'wb') as f:
+            N.save(f, dark)
+        path = os.path.join(self.path, name + '.npy')
+        self._darks.pop(name, None)  # unmap the old one
+        if os.path.exists(path):
+            os.remove(path)  # rename() doesn't replace files on Windows
+        os.rename(temp_path, path)
+        self._darks[name] = dark
+
+    def __len__(self):
+        return len(self._darks)
+
+
+def _name(source, shape, exposure):
+    source = re.sub(r'[^\w.-]+', '_', source or 'camera').strip('_')
+    size = 'x'.join(str(n) for n in shape)
+    exposure = 'auto' if exposure is None else '{:g}s'.format(exposure)
+    return '{}_{}_{}'.format(source, size, exposure)
@@ -1,8 +1,9 @@
 import numpy as N
-from traits.api import Range, Float
+from traits.api import Range, Float, Bool, Array
 from traitsui.api import View, VGroup, Item
 from pyface.timer.api import do_after
-from DisplayPlugin import DisplayPlugin
+from enable.api import ColorTrait
+from DisplayPlugin import DisplayPlugin, SCHEDULE_GROUP
 try:
     from pyface.api import beep
 except ImportError:
@@ -10,38 +11,111 @@ except ImportError:
     def beep():
         wx.Bell()
 
+MAP_TILES = 16  # the change map has this many tiles in each direction
+
 
 class DeltaDetector(DisplayPlugin):
+    """
+    Detects changes between consecutive frames: the largest change of any
+    pixel, the average change, and a coarse map of where the changes are.
+    The tiles of the map in which a pixel changed by more than @threshold
+    can be outlined on the image.
+    """
 
     threshold = Range(low=0.0, high=10000.0, value=20.0)
+    show_map = Bool(True)
     _maximum_delta = Float()
     _average_delta = Float()
+    # Largest change of any pixel in each tile of the map
+    _tile_deltas = Array()
+
+    # These control the visualization
+    color = ColorTrait('red')
 
     view = View(
         VGroup(
             Item('active'),
             Item('threshold'),
+            Item('show_map', label='Outline changed tiles'),
+            SCHEDULE_GROUP,
             label='Delta Detector',
             show_border=True))
 
     def __init__(self, **traits):
+        # Own copy of the previous frame, since the camera reuses the frame
+        # buffers, and the buffer that the difference goes into
         self._previous_frame = None
+        self._difference = None
+        self._row_edges = self._column_edges = None  # where the tiles start
         self._timed_out = False
         super(DeltaDetector, self).__init__(**traits)
+        self._tile_deltas = N.zeros((0, 0))
+        if self.screen is None:
+            return  # nothing to draw on
+        self.screen.data_store['delta_tiles_x'] = N.array([])
+        self.screen.data_store['delta_tiles_y'] = N.array([])
+        renderers = self.screen.plot.plot(('delta_tiles_x', 'delta_tiles_y'),
+            type='line',
+            color=self.color)
+        self._map_patch = renderers[0]
+        self._map_patch.visible = self.active and self.show_map
+
+        # Connect handlers
         self.on_trait_change(self._update_hud, '_maximum_delta,_average_delta',
             dispatch='ui')
+        self.on_trait_change(self._redraw_map, '_tile_deltas,threshold',
+            dispatch='ui')
 
-    def _process(self, frame):
+    def _show_map_changed(self, value):
+        if self.screen is not None:
+            self._map_patch.visible = self.active and value
+
+    def _process(self, context):
+        frame = context.data
         if (self._previous_frame is None
-            or self._previous_frame.shape != frame.shape):
-            self._maximum_delta = self._average_delta = 0.0
-            self._previous_frame = frame
+            or self._previous_frame.shape != frame.shape
+            or self._previous_frame.dtype != frame.dtype):
+            self._start(frame)
             return
 
-        self._maximum_delta = N.max(N.abs(frame - self._previous_frame))
-        self._average_delta = N.mean(frame - self._previous_frame)
+        # The difference goes into a reused buffer, and everything else is
+        # reduced from it, first tile by tile and then from the tiles.
+        # Subtract in the buffer's type, or unsigned pixels that get darker
+        # would wrap around.
+        difference = self._difference
+        N.subtract(frame, self._previous_frame, out=difference,
+            dtype=difference.dtype)
+        self._previous_frame[...] = frame
+        sums = _tile_reduce(N.add, difference, self._row_edges,
+            self._column_edges)
+        N.abs(difference, out=difference)
+        tile_deltas = _tile_reduce(N.maximum, difference, self._row_edges,
+            self._column_edges)
+
+        self._maximum_delta = tile_deltas.max()
+        self._average_delta = sums.sum() / difference.size
+        self._tile_deltas = tile_deltas
+
+    def _start(self, frame):
+        self._previous_frame = N.array(frame, copy=True)
+        # Up to 16 bits, the difference is exact in single precision
+        if frame.dtype.itemsize <= 2:
+            self._difference = N.empty(frame.shape, dtype=N.float32)
+        else:
+            self._difference = N.empty(frame.shape, dtype=float)
+        height, width = frame.shape[:2]
+        self._row_edges = _tile_edges(height)
+        self._column_edges = _tile_edges(width)
+        self._maximum_delta = self._average_delta = 0.0
+        self._tile_deltas = N.zeros((len(self._row_edges),
+            len(self._column_edges)))
 
-        self._previous_frame = frame
+    def results(self):
+        return {
+            'maximum_delta': float(self._maximum_delta),
+            'average_delta': float(self._average_delta),
+            'changed_tiles': int((self._tile_deltas > self.threshold).sum()),
+        }
 
     def _update_hud(self):
         if self._maximum_delta > self.threshold and not self._timed_out:
@@ -56,8 +130,59 @@ class DeltaDetector(DisplayPlugin):
             'Current average delta: {0._average_delta:.3f}\n'
             'Current maximum delta: {0._maximum_delta:.3f}'.format(self))
 
+    def _redraw_map(self):
+        # The outlines of all the changed tiles in one line plot, separated
+        # by NaN so that they are not connected to each other
+        rows, columns = N.nonzero(self._tile_deltas > self.threshold)
+        if len(rows):
+            height, width = self._previous_frame.shape[:2]
+            row_edges = N.append(self._row_edges, height)
+            column_edges = N.append(self._column_edges, width)
+            left, right = column_edges[columns], column_edges[columns + 1]
+            bottom, top = row_edges[rows], row_edges[rows + 1]
+        else:
+            left = right = bottom = top = N.zeros(0)
+        gap = N.empty(len(rows))
+        gap.fill(N.nan)
+        self.screen.data_store['delta_tiles_x'] = N.column_stack(
+            (left, right, right, left, left, gap)).ravel()
+        self.screen.data_store['delta_tiles_y'] = N.column_stack(
+            (bottom, bottom, top, top, bottom, gap)).ravel()
+
     def _switch_on_timeout(self):
         self._timed_out = False
 
+    def activate(self):
+        self._map_patch.visible = self.show_map
+
     def deactivate(self):
         self.screen.hud('delta', None)
+        self._map_patch.visible = False
+
+
+def _tile_edges(length):
+    """
+    Returns the starts of the MAP_TILES tiles that @length pixels are
+    divided into, or of one tile per pixel if there are fewer pixels
+    """
+    tiles = min(MAP_TILES, length)
+    return (N.arange(tiles) * length) // tiles
+
+
+def _tile_reduce(ufunc, data, row_edges, column_edges):
+    """
+    Reduces the pixels, and the color channels if any, of each tile of
+    @data with @ufunc; the tiles start at @row_edges and @column_edges
+    """
+    # Sum in double precision, so as not to lose any
+    dtype = float if ufunc is N.add else None
+    # Reducing each band of rows at once is much faster than reduceat()
+    # along the rows, which works one row at a time
+    row_ends = N.append(row_edges[1:], len(data))
+    tiles = N.array([
+        ufunc.reduceat(ufunc.reduce(data[start:end], axis=0, dtype=dtype),
+            column_edges, axis=0)
+        for start, end in zip(row_edges, row_ends)])
+    if tiles.ndim == 3:
+        tiles = ufunc.reduce(tiles, axis=2)
+    return tiles
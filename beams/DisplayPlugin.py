@@ -1,27 +1,121 @@
-import numpy as N
-from traits.api import HasTraits, Bool, Instance
+from traits.api import (HasTraits, Bool, Instance, Enum, Range, Property,
+    Float, on_trait_change)
+from traitsui.api import VGroup, Item
 from CameraImage import CameraImage
+from Frame import Frame, clock
+from FrameContext import FrameContext
+from Schedule import Schedule, RateMeter
+from Timing import get_histogram
+
+# Which frames a plugin analyzes
+EVERY_FRAME = 'every frame'
+WITH_DISPLAY = 'when the screen is updated'
+FIXED_RATE = 'at a fixed rate'
+EVERY_NTH_FRAME = 'every Nth frame'
+SCHEDULES = (EVERY_FRAME, WITH_DISPLAY, FIXED_RATE, EVERY_NTH_FRAME)
+
+# Settings for the schedule, to put in the plugins' views
+SCHEDULE_GROUP = VGroup(
+    Item('schedule', label='Analyze'),
+    Item('target_rate', label='Rate (Hz)',
+        visible_when="schedule == '{}'".format(FIXED_RATE)),
+    Item('every_nth', label='N',
+        visible_when="schedule == '{}'".format(EVERY_NTH_FRAME)),
+    Item('achieved_rate', style='readonly', format_str='%.1f Hz'))
 
 
 class DisplayPlugin(HasTraits):
 
     active = Bool(False)
-    screen = Instance(CameraImage)
+    screen = Instance(CameraImage)  # None when running without a display
+
+    # The frame that is being processed, so that results can be matched up
+    # with its sequence number and timestamp
+    current_frame = Instance(Frame)
+
+    # Whether _process() may run at the same time as other plugins'. Plugins
+    # that use something that is shared between plugins should set this to
+    # False, so they are run in the processing thread instead of the pool.
+    thread_safe = True
 
-    def process_frame(self, frame):
-        if not self.active:
+    # Which frames to analyze; cheap plugins can keep up with every frame,
+    # while expensive ones should analyze fewer so as not to hold up the rest
+    schedule = Enum(WITH_DISPLAY, SCHEDULES)
+    target_rate = Range(0.1, 500.0, 5.0)
+    every_nth = Range(1, 1000, 1)
+    # How often the plugin actually analyzed a frame recently, per second.
+    # It is calculated when it is read; call update_achieved_rate() now and
+    # then to show the new value in the views.
+    achieved_rate = Property()
+
+    _frame_schedule = Instance(Schedule)  # default: None
+    _rate_meter = Instance(RateMeter, ())
+    _shown_rate = Float()  # achieved_rate when the views were last told
+
+    def process_frame(self, context, display_due=True):
+        """
+        Analyzes a frame if it is due according to the schedule. @context is
+        the FrameContext that all plugins share for the frame; a Frame is
+        also accepted. @display_due says whether the screen is being updated
+        with this frame.
+        """
+        if not self.active or not self._is_due(display_due):
             return
 
-        # Make sure we are operating on a copy, since the array can change
-        self._process(N.array(frame, dtype=float, copy=True))
+        if not isinstance(context, FrameContext):
+            context = FrameContext(context)
+        self._rate_meter.tick()
+        self.current_frame = context.frame
+        start = clock()
+        self._process(context)
+        get_histogram('analysis ' + type(self).__name__).add(clock() - start)
+
+    def _is_due(self, display_due):
+        if self.schedule == EVERY_FRAME:
+            return True
+        if self.schedule == WITH_DISPLAY:
+            return display_due
+        if self._frame_schedule is None:
+            self._reset_schedule()
+        return self._frame_schedule.due()
+
+    @on_trait_change('schedule,target_rate,every_nth')
+    def _reset_schedule(self):
+        if self.schedule == FIXED_RATE:
+            self._frame_schedule = Schedule(rate=self.target_rate)
+        else:
+            self._frame_schedule = Schedule(every=self.every_nth)
+
+    def _get_achieved_rate(self):
+        return self._rate_meter.rate
+
+    def update_achieved_rate(self):
+        """
+        Notifies the listeners, such as the views, if achieved_rate changed.
+        Call this in the GUI thread.
+        """
+        rate = self.achieved_rate
+        if rate != self._shown_rate:
+            self.trait_property_changed('achieved_rate', self._shown_rate,
+                rate)
+            self._shown_rate = rate
+
+    def results(self):
+        """
+        Returns a dict of the results of the last frame that was analyzed,
+        with names as keys and numbers as values.
+        """
+        return {}
 
     def _active_changed(self, value):
+        if self.screen is None:
+            return
         if value:
             self.activate()
         else:
             self.deactivate()
 
-    def _process(self, frame):
+    def _process(self, context):
         pass
 
     def activate(self):
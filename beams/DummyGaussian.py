@@ -1,16 +1,19 @@
-import time
 import numpy as N
 import numpy.random
-from traits.api import Int, Constant, Range, Property, cached_property
+from traits.api import (Int, Constant, Range, Property, cached_property,
+    Callable)
 from traitsui.api import View, Item, HGroup, VGroup, Label
 
 from Camera import Camera
 
+# Limit on the memory used for precomputed noise
+MAX_NOISE_BYTES = 64 * 1024 * 1024
+
 
 class DummyGaussian(Camera):
     plugin_info = {
         'name': 'Dummy Gaussian',
-        'description': 'Fake Gaussian data with uniform random noise',
+        'description': 'Fake Gaussian beams with uniform random noise',
         'author': 'Philip Chimento',
         'copyright year': '2011',
     }
@@ -30,8 +33,19 @@ class DummyGaussian(Camera):
     # Necessary because Tuple(Range('trait_name', ...), ...) doesn't work
     centroid = Property(depends_on='centroid_x, centroid_y')
     radius = Range('_zero', '_half_minimum_resolution', 75)
+    # Ratio of the minor to the major radius, and rotation of the major axis
+    ellipticity = Range(0.1, 1.0, 1.0)
+    angle = Range(0.0, 180.0, 0.0)
+    # Several beams are laid out on a square grid around the centroid
+    num_beams = Range(1, 64, 1)
+    beam_spacing = Range(1.0, 1000.0, 100.0)
     amplitude = Int(60000)
     noise_amplitude = Int(5535)
+    # Seed for the noise, so that runs can be reproduced
+    seed = Int(0)
+    # Scripted drift: called with the frame number, returns the (x, y)
+    # displacement of the beams in pixels
+    drift = Callable()
 
     view = View(
         HGroup(
@@ -41,15 +55,27 @@ class DummyGaussian(Camera):
             Item('centroid_x'),
             Item('centroid_y')),
         Item('radius'),
+        Item('ellipticity'),
+        Item('angle', label=u'Angle (\N{DEGREE SIGN})'),
+        Item('num_beams', label='Number of beams'),
+        Item('beam_spacing', enabled_when='num_beams > 1'),
         Item('amplitude'),
         Item('noise_amplitude'),
+        Item('seed'),
         title='Dummy Gaussian Plugin')
 
     def __init__(self, **traits):
         super(DummyGaussian, self).__init__(resolution=(320, 240),
             id_string='Dummy Gaussian Plugin',
             **traits)
-        self._supported_resolutions = [(320, 240), (640, 480)]
+        self._supported_resolutions = [(320, 240), (640, 480), (1024, 768),
+            (1280, 1024), (2048, 2048), (4096, 4096)]
+        self._frame_number = 0
+        self._profile = None
+        self._profile_key = None
+        self._noise = None
+        self._noise_key = None
+        self._random = None
 
     @cached_property
     def _get__half_x_resolution(self):
@@ -71,28 +97,121 @@ class DummyGaussian(Camera):
         self.centroid_x, self.centroid_y = value
 
     def open(self):
-        pass
+        self._frame_number = 0
+        self._frame_deadline = None
+        self._random = numpy.random.RandomState(self.seed)
 
     def close(self):
         pass
 
     def query_frame(self):
-        """Returns a Gaussian with uniform random noise"""
+        """
+        Returns Gaussian beams with uniform random noise. The noiseless image
+        is only computed again when the settings change, and the noise is
+        taken from a precomputed block at a random offset.
+        """
+        if self._random is None:
+            self.open()
         width, height = self.resolution
-        x, y = N.ogrid[0:height, 0:width]
-        y0, x0 = self.centroid
-        r = N.hypot(x - x0, y - y0)
-        self.frame = N.array(N.exp(-r ** 2 / self.radius ** 2) * self.amplitude,
-            dtype=N.uint16)
-        self.frame += N.random.uniform(low=0, high=self.noise_amplitude,
-            size=(height, width))
+        shape = (height, width)
+        frame = self._get_buffer(shape, N.uint16)
+        profile = self._get_profile(shape)
+
+        if self.noise_amplitude > 0:
+            noise = self._get_noise(shape)
+            ix = self._random.randint(len(noise))
+            offset = self._random.randint(frame.size)
+            # Add noise block @ix, rotated by @offset pixels
+            out, profile = frame.reshape(-1), profile.reshape(-1)
+            noise = noise[ix].reshape(-1)
+            rest = frame.size - offset
+            N.add(profile[:rest], noise[offset:], out=out[:rest])
+            N.add(profile[rest:], noise[:offset], out=out[rest:])
+        else:
+            frame[...] = profile
+        self.frame = frame
+        self._frame_number += 1
 
         # Simulate frame rate
-        time.sleep(1.0 / self.frame_rate)
+        self._wait_for_next_frame()
 
     def find_resolutions(self):
         return self._supported_resolutions
 
+    def _get_profile(self, shape):
+        """Returns the noiseless image, computing it if necessary"""
+        x0, y0 = self.centroid
+        if self.drift is not None:
+            dx, dy = self.drift(self._frame_number)
+            x0, y0 = x0 + dx, y0 + dy
+        key = (shape, x0, y0, self.radius, self.ellipticity, self.angle,
+            self.num_beams, self.beam_spacing, self.amplitude,
+            self.noise_amplitude)
+        if key != self._profile_key:
+            self._profile = _render_beams(shape, _beam_positions(x0, y0,
+                self.num_beams, self.beam_spacing), self.radius,
+                self.ellipticity, self.angle, self.amplitude,
+                # Leave room for the noise so that the sum doesn't overflow
+                65535 - self.noise_amplitude)
+            self._profile_key = key
+        return self._profile
+
+    def _get_noise(self, shape):
+        """Returns a few frames' worth of noise, computing it if necessary"""
+        key = (shape, self.noise_amplitude, self.seed)
+        if key != self._noise_key:
+            frame_bytes = shape[0] * shape[1] * 2
+            count = max(2, min(8, MAX_NOISE_BYTES // frame_bytes))
+            rng = numpy.random.RandomState(self.seed)
+            self._noise = N.empty((count,) + shape, dtype=N.uint16)
+            for block in self._noise:
+                block[...] = rng.randint(0, self.noise_amplitude, size=shape,
+                    dtype=N.uint16)
+            self._noise_key = key
+        return self._noise
+
+    def _seed_changed(self):
+        self._random = numpy.random.RandomState(self.seed)
+
+
+def _beam_positions(x0, y0, num_beams, spacing):
+    """Lays out @num_beams on a square grid centered on (@x0, @y0)"""
+    columns = int(N.ceil(N.sqrt(num_beams)))
+    rows = int(N.ceil(float(num_beams) / columns))
+    ix = N.arange(num_beams)
+    x = x0 + (ix % columns - (columns - 1) / 2.0) * spacing
+    y = y0 + (ix // columns - (rows - 1) / 2.0) * spacing
+    return zip(x, y)
+
+
+def _render_beams(shape, positions, radius, ellipticity, angle, amplitude,
+        maximum):
+    """
+    Draws elliptical Gaussian beams with 1/e radius @radius. Each beam is
+    only computed in a window around its center, outside of which it is
+    less than one count.
+    """
+    height, width = shape
+    canvas = N.zeros(shape, dtype=N.float32)
+    a = max(float(radius), 1e-3)
+    b = max(a * ellipticity, 1e-3)
+    theta = N.radians(angle)
+    cos_t, sin_t = N.cos(theta), N.sin(theta)
+    reach = a * N.sqrt(N.log(max(amplitude, 1)) + 1)
+    for x0, y0 in positions:
+        left, right = max(int(x0 - reach), 0), min(int(x0 + reach) + 1, width)
+        bottom, top = max(int(y0 - reach), 0), min(int(y0 + reach) + 1, height)
+        if left >= right or bottom >= top:
+            continue
+        y, x = N.ogrid[bottom:top, left:right]
+        dx, dy = x - x0, y - y0
+        u = (dx * cos_t + dy * sin_t) / a
+        v = (dy * cos_t - dx * sin_t) / b
+        canvas[bottom:top, left:right] += N.exp(-(u ** 2 + v ** 2))
+    canvas *= amplitude
+    N.clip(canvas, 0, maximum, out=canvas)
+    return canvas.astype(N.uint16)
+
 #if __name__ == '__main__':
 #    cam = DummyGaussian()
 #    print cam.find_resolutions()
@@ -0,0 +1,61 @@
+import time
+
+# Monotonic clock for frame timestamps; Python 2 only has time.time()
+clock = getattr(time, 'monotonic', time.time)
+
+
+class Frame(object):
+    """
+    A camera image together with information about how it was captured. The
+    array in @data is wrapped, not copied.
+
+    @sequence: number of the frame since the camera was created
+    @timestamp: capture time according to clock()
+    @exposure: exposure time in seconds, or None if not known
+    @roi: region of interest of the camera when the frame was taken
+    @source: id string of the camera
+    @channel: number of the camera when several are acquired at once
+    """
+
+    __slots__ = ('data', 'sequence', 'timestamp', 'exposure', 'roi',
+        'source', 'channel', '_pool', '_buffer')
+
+    def __init__(self, data, sequence=0, timestamp=None, exposure=None,
+            roi=None, source='', channel=0, pool=None, buffer=None):
+        self.data = data
+        self.sequence = sequence
+        self.timestamp = clock() if timestamp is None else timestamp
+        self.exposure = exposure
+        self.roi = roi
+        self.source = source
+        self.channel = channel
+        self._pool = pool
+        # Pool buffer that @data is a view of, if not the same array
+        self._buffer = data if buffer is None else buffer
+
+    def derive(self, data):
+        """
+        Returns a Frame with the same metadata for @data, which was computed
+        from this frame. The new frame does not own a pool buffer.
+        """
+        return Frame(data, self.sequence, self.timestamp, self.exposure,
+            self.roi, self.source, self.channel)
+
+    def release(self):
+        """Hands the array back to the pool it came from, if any."""
+        if self._pool is not None:
+            self._pool.release(self._buffer)
+            self._pool = None
+
+    @property
+    def age(self):
+        """Seconds since the frame was captured"""
+        return clock() - self.timestamp
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def dtype(self):
+        return self.data.dtype
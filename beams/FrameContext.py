@@ -0,0 +1,98 @@
+import threading
+import numpy as N
+
+from Moments import projection
+from Percentile import has_histogram, histogram
+
+
+class FrameContext(object):
+    """
+    A frame that is being analyzed, together with quantities derived from
+    it. All analysis plugins get the same context for a frame, and each
+    derived quantity is computed the first time a plugin asks for it and
+    then shared, so that e.g. the grayscale conversion is only done once per
+    frame. This is safe when the plugins run in parallel.
+
+    The derived arrays are read-only and don't share memory with the camera
+    buffer, so plugins may keep them after the frame is done. @data is the
+    camera buffer itself and must not be kept or changed.
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+        self._products = {}
+        self._locks = {}
+
+    @property
+    def data(self):
+        """The frame's array, in the camera's own data type"""
+        return self.frame.data
+
+    @property
+    def is_monochrome(self):
+        return self.frame.data.ndim == 2
+
+    @property
+    def float_data(self):
+        """A floating point copy of the frame"""
+        return self._product('float_data', self._calculate_float_data)
+
+    @property
+    def gray(self):
+        """
+        Floating point grayscale image: the same as @float_data for a
+        monochrome frame, otherwise converted from RGB
+        """
+        if self.is_monochrome:
+            return self.float_data
+        return self._product('gray', self._calculate_gray)
+
+    @property
+    def row_projection(self):
+        """Sum of each row of the grayscale image"""
+        return self._product('row_projection',
+            lambda: projection(self._monochrome_data, 1))
+
+    @property
+    def column_projection(self):
+        """Sum of each column of the grayscale image"""
+        return self._product('column_projection',
+            lambda: projection(self._monochrome_data, 0))
+
+    @property
+    def _monochrome_data(self):
+        # Monochrome frames can be summed without a floating point copy
+        return self.data if self.is_monochrome else self.gray
+
+    @property
+    def histogram(self):
+        """
+        Number of pixels with each value, for monochrome frames of 8- or
+        16-bit unsigned integers; None for other frames
+        """
+        if not self.is_monochrome or not has_histogram(self.data):
+            return None
+        return self._product('histogram', lambda: histogram(self.data))
+
+    def _product(self, name, calculate):
+        try:
+            return self._products[name]
+        except KeyError:
+            pass
+        with self._locks.setdefault(name, threading.Lock()):
+            # Another thread may have calculated it while we were waiting
+            if name not in self._products:
+                value = calculate()
+                value.flags.writeable = False
+                self._products[name] = value
+        return self._products[name]
+
+    def _calculate_float_data(self):
+        return N.array(self.data, dtype=float, copy=True)
+
+    def _calculate_gray(self):
+        # Use standard NTSC conversion formula
+        data = self.data
+        return (0.2989 * data[..., 0]
+            + 0.5870 * data[..., 1]
+            + 0.1140 * data[..., 2])
@@ -0,0 +1,155 @@
+import collections
+import itertools
+import threading
+
+DROP_OLDEST = 'drop oldest'
+DROP_NEWEST = 'drop newest'
+BLOCK = 'block'
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+class FrameMailbox(object):
+    """
+    Bounded handoff of frames from the acquisition threads to the processing
+    threads. It holds at most @capacity frames per camera channel; what
+    happens when a frame arrives and its channel is full depends on @policy:
+
+    - DROP_OLDEST: the oldest waiting frame is discarded ("latest wins"),
+    - DROP_NEWEST: the arriving frame is discarded,
+    - BLOCK: the acquisition thread waits until there is room.
+
+    Several processing threads can take frames from the mailbox at once, but
+    a channel's next frame is only handed out after the previous one was
+    marked as processed, so the plugins of one camera never run
+    concurrently on two frames.
+
+    Discarded frames are passed to @on_drop, so that their buffers can be
+    given back to the camera. Every arriving frame is first passed to
+    @on_put, in the acquisition thread, before it can be dropped. The
+    mailbox counts the frames that were acquired, processed and dropped.
+    """
+
+    def __init__(self, capacity=1, policy=DROP_OLDEST, on_drop=None,
+            on_put=None):
+        if policy not in POLICIES:
+            raise ValueError('Unknown policy {!r}'.format(policy))
+        self._capacity = max(1, capacity)
+        self.policy = policy
+        self.on_drop = on_drop
+        self.on_put = on_put
+        self._frames = collections.defaultdict(collections.deque)
+        self._busy = set()  # channels whose frame is being processed
+        self._arrivals = itertools.count()
+        self._closed = False
+        self._condition = threading.Condition()
+        self.reset_statistics()
+
+    # Public
+
+    def put(self, frame):
+        """
+        Offers @frame to the processing threads. Returns False if the frame
+        was dropped.
+        """
+        if self.on_put is not None:
+            self.on_put(frame)
+        dropped = None
+        with self._condition:
+            self.frames_acquired += 1
+            frames = self._frames[frame.channel]
+            if self.policy == BLOCK:
+                while len(frames) >= self._capacity and not self._closed:
+                    self._condition.wait()
+            if self._closed or (self.policy == DROP_NEWEST
+                    and len(frames) >= self._capacity):
+                dropped = frame
+            else:
+                if len(frames) >= self._capacity:
+                    dropped = frames.popleft()[1]
+                frames.append((next(self._arrivals), frame))
+            if dropped is not None:
+                self.frames_dropped += 1
+            self._condition.notify_all()
+        if dropped is not None and self.on_drop is not None:
+            self.on_drop(dropped)
+        return dropped is not frame
+
+    def get(self):
+        """
+        Waits for the next frame of a channel that is not being processed,
+        and returns it. Returns None once the mailbox has been closed.
+        """
+        with self._condition:
+            while True:
+                if self._closed:
+                    return None
+                waiting = [(frames[0][0], channel)
+                    for channel, frames in self._frames.items()
+                    if frames and channel not in self._busy]
+                if waiting:
+                    break
+                self._condition.wait()
+            channel = min(waiting)[1]
+            self._busy.add(channel)
+            frame = self._frames[channel].popleft()[1]
+            self._condition.notify_all()
+            return frame
+
+    def mark_processed(self, frame):
+        """
+        Called by the processing thread when it has finished @frame, which
+        it got from get().
+        """
+        with self._condition:
+            self.frames_processed += 1
+            self._busy.discard(frame.channel)
+            self._condition.notify_all()
+
+    def close(self):
+        """Wakes up all waiting threads and discards any waiting frames."""
+        with self._condition:
+            self._closed = True
+            leftover = [frame for frames in self._frames.values()
+                for _, frame in frames]
+            self._frames.clear()
+            self._condition.notify_all()
+        if self.on_drop is not None:
+            for frame in leftover:
+                self.on_drop(frame)
+
+    def statistics(self):
+        """Returns a dict of the frame counters."""
+        with self._condition:
+            return {
+                'acquired': self.frames_acquired,
+                'processed': self.frames_processed,
+                'dropped': self.frames_dropped,
+                'waiting': sum(len(f) for f in self._frames.values())
+            }
+
+    def reset_statistics(self):
+        self.frames_acquired = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+
+    def _get_capacity(self):
+        return self._capacity
+
+    def _set_capacity(self, value):
+        dropped = []
+        with self._condition:
+            self._capacity = max(1, value)
+            for frames in self._frames.values():
+                while len(frames) > self._capacity:
+                    dropped.append(frames.popleft()[1])
+                    self.frames_dropped += 1
+            self._condition.notify_all()
+        if self.on_drop is not None:
+            for frame in dropped:
+                self.on_drop(frame)
+
+    capacity = property(_get_capacity, _set_capacity)
+
+    def __len__(self):
+        with self._condition:
+            return sum(len(f) for f in self._frames.values())
@@ -0,0 +1,82 @@
+import threading
+import time
+import numpy as N
+
+
+class FramePool(object):
+    """
+    A fixed number of preallocated frame buffers. Camera drivers acquire a
+    buffer, fill it in place, and the processing pipeline releases it again
+    when it is done with the frame, so that no memory is allocated per frame
+    and the memory in use stays constant even if processing falls behind.
+
+    The buffers are allocated lazily for the first shape and dtype that is
+    requested. If a different shape or dtype is requested later (for example,
+    because the camera resolution changed) the pool is reallocated; buffers of
+    the old shape that are released afterwards are simply forgotten.
+    """
+
+    def __init__(self, size=8):
+        self.size = size
+        self._condition = threading.Condition()
+        self._shape = None
+        self._dtype = None
+        self._owned = {}  # id -> buffer, keeps all buffers alive
+        self._free = []
+
+    def acquire(self, shape, dtype, block=True, timeout=None):
+        """
+        Returns a buffer of @shape and @dtype. If all buffers are in use,
+        waits for one to be released, unless @block is False. Returns None
+        if no buffer became available within @timeout seconds.
+        """
+        shape = tuple(shape)
+        dtype = N.dtype(dtype)
+        with self._condition:
+            if shape != self._shape or dtype != self._dtype:
+                self._allocate(shape, dtype)
+            if not self._free and block:
+                deadline = None if timeout is None else time.time() + timeout
+                while not self._free:
+                    if deadline is None:
+                        self._condition.wait()
+                        continue
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            if not self._free:
+                return None
+            return self._free.pop()
+
+    def release(self, buffer):
+        """
+        Hands @buffer back to the pool. Arrays that do not belong to the pool
+        are ignored, so it is safe to release any frame.
+        """
+        with self._condition:
+            if self._owned.get(id(buffer)) is not buffer:
+                return
+            if any(buffer is b for b in self._free):
+                return  # already released
+            self._free.append(buffer)
+            self._condition.notify()
+
+    def owns(self, buffer):
+        """Returns True if @buffer is one of this pool's current buffers."""
+        with self._condition:
+            return self._owned.get(id(buffer)) is buffer
+
+    @property
+    def num_free(self):
+        """The number of buffers that are currently available."""
+        with self._condition:
+            return len(self._free)
+
+    def _allocate(self, shape, dtype):
+        self._shape = shape
+        self._dtype = dtype
+        self._free = [N.empty(shape, dtype=dtype) for _ in range(self.size)]
+        self._owned = dict((id(b), b) for b in self._free)
+        # Wake up anyone waiting for the old buffers
+        self._condition.notify_all()
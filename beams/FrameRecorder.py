@@ -0,0 +1,115 @@
+import json
+import os.path
+import threading
+import Queue as queue  # in Python 3: import queue
+
+from FramePool import FramePool
+
+
+class FrameRecorder(object):
+    """
+    Streams frames to disk from a background writer thread. The frames are
+    written one after another in their own data type to @path (a .raw file),
+    with a JSON header next to it that ReplayCamera understands, and an index
+    file (.csv) with the sequence number, timestamp and exposure time of each
+    frame.
+
+    write() copies the frame into one of @buffer_frames preallocated buffers
+    and returns immediately; if the disk can't keep up and all buffers are
+    full, the frame is dropped and counted, but the caller is never blocked.
+    Only every @every'th frame is recorded.
+    """
+
+    def __init__(self, path, every=1, buffer_frames=64):
+        base = os.path.splitext(path)[0]
+        self.path = base + '.raw'
+        self.header_path = base + '.json'
+        self.index_path = base + '.csv'
+        self.every = max(1, every)
+        self.frames_written = 0
+        self.frames_dropped = 0
+
+        self._frames_offered = 0
+        self._shape = None
+        self._dtype = None
+        self._first_timestamp = None
+        self._last_timestamp = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._pool = FramePool(size=buffer_frames)
+        self._queue = queue.Queue()
+        self._file = open(self.path, 'wb')
+        self._index = open(self.index_path, 'w')
+        self._index.write('frame,sequence,timestamp,exposure\n')
+        self._thread = threading.Thread(target=self._write_frames)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, frame):
+        """Records @frame, a Frame, unless it is skipped or dropped."""
+        if self._closed:
+            return
+        self._frames_offered += 1
+        if (self._frames_offered - 1) % self.every != 0:
+            return
+        if self._shape is None:
+            self._shape, self._dtype = frame.shape, frame.dtype
+            self._write_header()
+        if frame.shape != self._shape or frame.dtype != self._dtype:
+            # Resolution changed; the file can only contain one frame size
+            self.frames_dropped += 1
+            return
+        buffer = self._pool.acquire(self._shape, self._dtype, block=False)
+        if buffer is None:
+            self.frames_dropped += 1
+            return
+        buffer[...] = frame.data
+        with self._lock:
+            if self._closed:
+                self._pool.release(buffer)
+                return
+            self._queue.put((buffer, frame.sequence, frame.timestamp,
+                frame.exposure))
+
+    def close(self):
+        """Writes the remaining frames and closes the files."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+        self._index.close()
+        if self._shape is not None:
+            self._write_header()
+
+    def _write_frames(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            buffer, sequence, timestamp, exposure = item
+            buffer.tofile(self._file)
+            self._pool.release(buffer)
+            self._index.write('{},{},{!r},{}\n'.format(self.frames_written,
+                sequence, timestamp, '' if exposure is None else exposure))
+            if self._first_timestamp is None:
+                self._first_timestamp = timestamp
+            self._last_timestamp = timestamp
+            self.frames_written += 1
+
+    def _write_header(self):
+        header = {
+            'width': self._shape[1],
+            'height': self._shape[0],
+            'channels': self._shape[2] if len(self._shape) > 2 else 1,
+            'dtype': self._dtype.str,
+            'frames': self.frames_written,
+        }
+        if self.frames_written > 1:
+            duration = self._last_timestamp - self._first_timestamp
+            if duration > 0:
+                header['frame_rate'] = (self.frames_written - 1) / duration
+        with open(self.header_path, 'w') as f:
+            json.dump(header, f, indent=4, sort_keys=True)
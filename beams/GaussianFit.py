@@ -0,0 +1,224 @@
+"""
+Least-squares fit of an elliptical 2-D Gaussian to a beam image.
+
+The model is
+
+    amplitude * exp(-u^2 / (2 sigma_a^2) - v^2 / (2 sigma_b^2)) + offset
+
+where u and v are the coordinates along the ellipse's axes: the distance
+from the center (x0, y0), rotated by the angle (in radians). The fit uses
+the analytic derivatives of the model, and a fit on a binned image can be
+used to get close before fitting on full resolution pixels.
+
+The fit is a Levenberg-Marquardt fit on the normal equations, which are
+only 7 by 7. That is less robust than scipy.optimize.leastsq() for badly
+conditioned problems, but leastsq() factorizes the whole Jacobian, one row
+per pixel, which takes longer than calculating the model.
+"""
+
+import numpy as N
+
+# Index of each fit parameter
+AMPLITUDE, X0, Y0, SIGMA_A, SIGMA_B, ANGLE, OFFSET = range(7)
+
+MAX_ITERATIONS = 30  # per fit; starting from a good guess takes only a few
+TOLERANCE = 1e-6  # relative change in the parameters at convergence
+
+
+def second_moments(params):
+    """Returns the second moments m20, m02, m11 of the Gaussian @params"""
+    var_a, var_b = params[SIGMA_A] ** 2, params[SIGMA_B] ** 2
+    cos, sin = N.cos(params[ANGLE]), N.sin(params[ANGLE])
+    return (var_a * cos ** 2 + var_b * sin ** 2,
+        var_a * sin ** 2 + var_b * cos ** 2,
+        (var_a - var_b) * sin * cos)
+
+
+def gaussian(params, x, y):
+    """
+    Returns the Gaussian @params at @x and @y, which may be arrays that
+    broadcast against each other, such as the ones from N.ogrid
+    """
+    g, u, v = _exponential(params, x, y)
+    return params[AMPLITUDE] * g + params[OFFSET]
+
+
+def _exponential(params, x, y):
+    dx = x - params[X0]
+    dy = y - params[Y0]
+    cos, sin = N.cos(params[ANGLE]), N.sin(params[ANGLE])
+    u = dx * cos + dy * sin
+    v = dy * cos - dx * sin
+    g = N.exp(-0.5 * ((u / params[SIGMA_A]) ** 2
+        + (v / params[SIGMA_B]) ** 2))
+    return g, u, v
+
+
+class _Fit(object):
+    """
+    The residuals and their derivatives. The derivatives are needed at the
+    parameters whose residuals were just calculated, so the exponential is
+    kept from one call to the next.
+    """
+
+    def __init__(self, x, y, data):
+        self.x, self.y, self.data = x, y, data
+        self._params = None
+        self._terms = None
+        self._jacobian = N.empty((7,) + data.shape)
+
+    def _exponential(self, params):
+        if self._params is None or not N.array_equal(params, self._params):
+            self._params = params.copy()
+            self._terms = _exponential(params, self.x, self.y)
+        return self._terms
+
+    def residuals(self, params):
+        g = self._exponential(params)[0]
+        result = g * params[AMPLITUDE]
+        result += params[OFFSET] - self.data
+        return result.ravel()
+
+    def jacobian(self, params):
+        # One row per parameter. The model is
+        # A g + offset with g = exp(-E), so the derivative with respect to
+        # a parameter p of the exponent is -A g dE/dp. The rows are filled
+        # in place to save on temporary arrays.
+        g, u, v = self._exponential(params)
+        var_a, var_b = params[SIGMA_A] ** 2, params[SIGMA_B] ** 2
+        cos, sin = N.cos(params[ANGLE]), N.sin(params[ANGLE])
+        result = self._jacobian
+        result[AMPLITUDE] = g
+        ag = N.multiply(g, params[AMPLITUDE], out=result[OFFSET])
+        ua = u / var_a
+        vb = v / var_b
+        N.multiply(ua, cos, out=result[X0])
+        result[X0] -= N.multiply(vb, sin, out=result[Y0])
+        result[X0] *= ag
+        N.multiply(ua, sin, out=result[Y0])
+        result[Y0] += N.multiply(vb, cos, out=result[ANGLE])
+        result[Y0] *= ag
+        N.multiply(ag, u, out=result[ANGLE])
+        N.multiply(result[ANGLE], ua, out=result[SIGMA_A])
+        result[SIGMA_A] /= params[SIGMA_A]
+        N.multiply(ag, v, out=result[SIGMA_B])
+        result[ANGLE] *= v
+        result[ANGLE] *= 1 / var_b - 1 / var_a
+        result[SIGMA_B] *= vb
+        result[SIGMA_B] /= params[SIGMA_B]
+        result[OFFSET] = 1.0
+        return result.reshape(7, -1)
+
+
+def fit_gaussian(frame, initial, left=0, top=0):
+    """
+    Fits a Gaussian to the 2-D array @frame, starting from the parameters
+    @initial. @frame's first pixel is at column @left and row @top, and the
+    parameters are in the same coordinates. Returns the fitted parameters,
+    or None if the fit failed.
+    """
+    if frame.size < len(initial):
+        return None  # not enough pixels to determine the parameters
+    height, width = frame.shape
+    y, x = N.ogrid[top:top + height, left:left + width]
+    fit = _Fit(x, y, N.asarray(frame, dtype=float))
+    params = _levenberg_marquardt(fit, N.array(initial, dtype=float))
+    if params is None or not N.all(N.isfinite(params)):
+        return None
+    return _normalize(params)
+
+
+def _levenberg_marquardt(fit, params):
+    residuals = fit.residuals(params)
+    cost = residuals.dot(residuals)
+    damping = 1e-3
+    for iteration in range(MAX_ITERATIONS):
+        jacobian = fit.jacobian(params)
+        hessian = jacobian.dot(jacobian.T)
+        gradient = jacobian.dot(residuals)
+        # The angle of a round Gaussian has no effect, so keep the scale
+        # of each parameter above zero
+        scale = N.diag(hessian)
+        scale = N.diag(N.maximum(scale, 1e-12 * scale.max()))
+        while True:
+            # Between a Gauss-Newton step and a gradient descent step,
+            # scaled by the curvature in each parameter
+            try:
+                step = N.linalg.solve(hessian + damping * scale, -gradient)
+            except N.linalg.LinAlgError:
+                return None
+            new_params = params + step
+            residuals = fit.residuals(new_params)
+            new_cost = residuals.dot(residuals)
+            if new_cost <= cost:
+                break
+            damping *= 10
+            if damping > 1e10:
+                return params  # no step makes it better: converged
+        params, cost = new_params, new_cost
+        damping = max(damping / 10, 1e-10)
+        if N.all(abs(step) <= TOLERANCE * (abs(params) + TOLERANCE)):
+            return params
+    return None
+
+
+def fit_binned(frame, initial, factor, left=0, top=0):
+    """
+    Like fit_gaussian(), but fits on @frame binned by @factor in both
+    directions, which is much faster and good enough as a starting point
+    for a fit on the full resolution image. If @initial is None, the fit
+    starts from estimate_parameters() of the binned image.
+    """
+    binned = bin_image(frame, factor)
+    if binned.size == 0:
+        return None
+    # A binned pixel's center is in the middle of its @factor pixels
+    shift = (factor - 1) / 2.0
+    scale = N.array([1.0, factor, factor, factor, factor, 1.0, 1.0])
+    origin = N.array([0.0, left + shift, top + shift, 0.0, 0.0, 0.0, 0.0])
+    if initial is None:
+        initial = estimate_parameters(binned)
+    else:
+        initial = (initial - origin) / scale
+    params = fit_gaussian(binned, initial)
+    if params is None:
+        return None
+    return params * scale + origin
+
+
+def estimate_parameters(frame):
+    """
+    Returns rough parameters of a round Gaussian for the beam in @frame,
+    from its brightest pixel and the area that is brighter than half of it
+    """
+    offset = N.median(frame)
+    row, column = N.unravel_index(N.argmax(frame), frame.shape)
+    amplitude = frame[row, column] - offset
+    # The half maximum ellipse has an area of 2 ln 2 pi sigma_a sigma_b
+    area = N.count_nonzero(frame > offset + amplitude / 2.0)
+    sigma = N.sqrt(max(area, 1) / (2 * N.log(2) * N.pi))
+    return N.array([amplitude, column, row, sigma, sigma, 0.0, offset])
+
+
+def bin_image(frame, factor):
+    """
+    Returns the means of blocks of @factor by @factor pixels of @frame,
+    leaving out the pixels at the edges that don't fill a block
+    """
+    height, width = frame.shape[0] // factor, frame.shape[1] // factor
+    blocks = frame[:height * factor, :width * factor].reshape(height, factor,
+        width, factor)
+    return blocks.mean(axis=(1, 3))
+
+
+def _normalize(params):
+    # The same Gaussian has many sets of parameters; make sigma_a the major
+    # axis and keep the angle between -90 and 90 degrees
+    params = params.copy()
+    params[SIGMA_A] = abs(params[SIGMA_A])
+    params[SIGMA_B] = abs(params[SIGMA_B])
+    if params[SIGMA_B] > params[SIGMA_A]:
+        params[SIGMA_A], params[SIGMA_B] = params[SIGMA_B], params[SIGMA_A]
+        params[ANGLE] += N.pi / 2
+    params[ANGLE] = (params[ANGLE] + N.pi / 2) % N.pi - N.pi / 2
+    return params
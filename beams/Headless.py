@@ -0,0 +1,218 @@
+"""
+Runs a camera through the transform and analysis plugins without a display,
+and writes the results of each frame to standard output or a file, as JSON
+lines or CSV. For example:
+
+    beams-headless --camera dummy --plugins BeamProfiler,Centroid
+"""
+
+import argparse
+import csv
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+
+# Don't let the plotting libraries look for a display
+os.environ.setdefault('ETS_TOOLKIT', 'null')
+
+import pkg_resources
+
+from CameraChannel import CameraChannel, load_plugins, DISPLAY_PLUGINS
+from DisplayPlugin import EVERY_FRAME
+from FrameMailbox import POLICIES, BLOCK
+from Pipeline import Pipeline
+import Timing
+
+FRAME_FIELDS = ['channel', 'sequence', 'timestamp', 'exposure', 'source']
+
+
+class ResultWriter(object):
+    """
+    Writes one row per analyzed frame, with the frame's sequence number,
+    timestamp etc. and the results of each plugin as "Plugin.result".
+    Called from the processing threads.
+
+    The CSV columns are those of the first frame. If a later frame has more
+    results, such as another spot, the file is rewritten with the new
+    columns; that needs a file opened for reading as well, so writing to
+    standard output stops with an error instead.
+    """
+
+    def __init__(self, stream, format='json', max_frames=None):
+        self.stream = stream
+        self.format = format
+        self.max_frames = max_frames
+        self.frames_written = 0
+        self.finished = threading.Event()
+        self.error = None  # why writing stopped early, if it did
+        self._lock = threading.Lock()
+        self._csv = None
+        self._columns = None
+
+    def __call__(self, channel, frame, results):
+        row = dict((field, getattr(frame, field)) for field in FRAME_FIELDS)
+        for plugin, values in results:
+            name = type(plugin).__name__
+            for key, value in values.items():
+                row[name + '.' + key] = value
+
+        with self._lock:
+            if self.finished.is_set():
+                return
+            if self.format == 'csv':
+                if not self._write_csv(row):
+                    self.finished.set()
+                    return
+            else:
+                self.stream.write(json.dumps(_without_nan(row),
+                    sort_keys=True, allow_nan=False) + '\n')
+            self.stream.flush()
+            self.frames_written += 1
+            if (self.max_frames is not None
+                    and self.frames_written >= self.max_frames):
+                self.finished.set()
+
+    def _write_csv(self, row):
+        """Writes @row, or returns False if it can't be written"""
+        if self._csv is None:
+            # The first frame decides the columns
+            self._start_csv(set(row), [])
+        elif not set(row) <= set(self._columns):
+            if not _is_rereadable(self.stream):
+                self.error = ('New results appeared after the CSV header was '
+                    'written: {}. Write CSV to a file with --output, or use '
+                    'JSON.'.format(', '.join(sorted(set(row)
+                        - set(self._columns)))))
+                return False
+            # Read back what was written, and write it again with the new
+            # columns, which are empty in the earlier rows
+            self.stream.seek(0)
+            rows = list(csv.DictReader(self.stream))
+            self.stream.seek(0)
+            self.stream.truncate()
+            self._start_csv(set(self._columns) | set(row), rows)
+        self._csv.writerow(row)
+        return True
+
+    def _start_csv(self, names, rows):
+        self._columns = FRAME_FIELDS + sorted(names - set(FRAME_FIELDS))
+        self._csv = csv.DictWriter(self.stream, self._columns,
+            lineterminator='\n')
+        self._csv.writeheader()
+        self._csv.writerows(rows)
+
+
+def _without_nan(row):
+    """
+    Returns @row with None for the results that are NaN or infinite, which
+    JSON can't represent
+    """
+    return dict((key, None if isinstance(value, float)
+        and (math.isnan(value) or math.isinf(value)) else value)
+        for key, value in row.items())
+
+
+def _is_rereadable(stream):
+    """Whether what was written to @stream can be read back"""
+    if '+' not in getattr(stream, 'mode', ''):
+        return False
+    try:
+        stream.tell()
+    except (IOError, OSError):
+        return False
+    return True
+
+
+def _split(names):
+    return [name for name in names.split(',') if name]
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(prog='beams-headless',
+        description='Analyze frames from a camera without a display.')
+    parser.add_argument('--camera', default='dummy',
+        help='camera plugin to use (default: %(default)s)')
+    parser.add_argument('--transforms', type=_split, default=[],
+        help='comma-separated transform plugins to apply, in order')
+    parser.add_argument('--plugins', type=_split, default=DISPLAY_PLUGINS,
+        help='comma-separated analysis plugins to run (default: all)')
+    parser.add_argument('--format', choices=['json', 'csv'], default='json',
+        help='write JSON lines or CSV (default: %(default)s)')
+    parser.add_argument('--output', '-o',
+        help='file to write the results to (default: standard output)')
+    parser.add_argument('--frames', type=int,
+        help='stop after this many frames')
+    parser.add_argument('--duration', type=float,
+        help='stop after this many seconds')
+    parser.add_argument('--queue-length', type=int, default=1,
+        help='frames that may wait for processing (default: %(default)s)')
+    parser.add_argument('--queue-policy', choices=POLICIES, default=BLOCK,
+        help='what to do when the queue is full (default: %(default)s)')
+    parser.add_argument('--subprocess', action='store_true',
+        help='run the camera in a separate process')
+    parser.add_argument('--serial', action='store_true',
+        help="run the analysis plugins one after another")
+    parser.add_argument('--timing', action='store_true',
+        help='print the latency of each pipeline stage at the end')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    logging.basicConfig()  # errors in the plugins go to standard error
+
+    cameras = pkg_resources.get_entry_map('beams', 'camera_plugins')
+    if args.camera not in cameras:
+        sys.exit('Unknown camera {}; available: {}'.format(args.camera,
+            ', '.join(sorted(cameras))))
+    camera = cameras[args.camera].load()()
+    camera.open()
+
+    channel = CameraChannel(camera=camera, screen=None,
+        transform_plugins=load_plugins(args.transforms, active=True),
+        display_plugins=load_plugins(args.plugins, screen=None, active=True,
+            schedule=EVERY_FRAME))
+
+    # Also open the file for reading, in case the CSV header has to change
+    stream = sys.stdout if args.output is None else open(args.output, 'w+')
+    writer = ResultWriter(stream, args.format, max_frames=args.frames)
+    pipeline = Pipeline([channel], queue_length=args.queue_length,
+        queue_policy=args.queue_policy, on_results=writer)
+    pipeline.parallel_plugins = not args.serial
+    pipeline.acquire_in_subprocess = args.subprocess
+
+    start = time.time()
+    pipeline.start_acquisition(channel)
+    try:
+        while not writer.finished.is_set():
+            if (args.duration is not None
+                    and time.time() - start >= args.duration):
+                break
+            # Wait in short steps so that Ctrl+C is noticed
+            writer.finished.wait(0.1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.finished.set()
+        pipeline.close()
+        camera.close()
+        if stream is not sys.stdout:
+            stream.close()
+
+    stats = pipeline.statistics()
+    elapsed = time.time() - start
+    sys.stderr.write('{} frames analyzed in {:.1f} s ({:.1f} fps), '
+        '{} dropped\n'.format(writer.frames_written, elapsed,
+            writer.frames_written / elapsed, stats['dropped']))
+    if args.timing:
+        sys.stderr.write(Timing.report() + '\n')
+    if writer.error is not None:
+        sys.exit(writer.error)
+
+
+if __name__ == '__main__':
+    main()
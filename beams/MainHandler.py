@@ -2,9 +2,11 @@
 import scipy.misc
 from traits.api import TraitError
 from traitsui.api import Handler
-from pyface.api import AboutDialog, FileDialog, OK
+from pyface.api import AboutDialog, FileDialog, OK, error
 
-from AcquisitionThread import AcquisitionThread
+from FrameRecorder import FrameRecorder
+from Camera import CameraError
+from CameraDialog import CameraDialog
 from IconFinder import find_icon
 
 
@@ -21,8 +23,14 @@ class MainHandler(Handler):
         dialog.open()
 
     def action_save(self, info):
-        # First make a copy of the frame we will save
-        save_frame = info.object.camera.frame.copy()
+        # First make a copy of the frame we will save. Take the one on the
+        # screen: the camera's own frame is a pool buffer that the next
+        # frame is written into, and when acquiring in a subprocess it is
+        # not even being updated.
+        save_frame = info.object.screen.data.copy()
+        if save_frame.size == 0:
+            error(None, 'There is no image to save yet.')
+            return
 
         # Then find out where to save it
         dialog = FileDialog(parent=info.ui.control, action='save as', modal=True,
@@ -47,32 +55,61 @@ class MainHandler(Handler):
         # Save it
         scipy.misc.imsave(path, save_frame)
 
+    def action_record(self, info):
+        win = info.object
+        if win.recorder is not None:
+            recorder, win.recorder = win.recorder, None
+            recorder.close()
+            return
+
+        dialog = FileDialog(parent=info.ui.control, action='save as',
+            modal=True, title='Record Frames', wildcard='*.raw')
+        try:
+            dialog.default_directory = win._current_folder
+        except TraitError:
+            pass   # thrown if _current_folder is None
+        dialog.open()
+        if dialog.return_code != OK:
+            return
+        win._current_folder = dialog.directory
+        win.recorder = FrameRecorder(dialog.path, every=win.record_every)
+
     def action_choose_camera(self, info):
         info.object.cameras_dialog.edit_traits()
 
+    def action_add_camera(self, info):
+        dialog = CameraDialog()
+        dialog.edit_traits(parent=info.ui.control, kind='livemodal')
+        try:
+            channel = info.object.add_camera(dialog.get_plugin_object())
+        except CameraError:
+            error(info.ui.control, 'The camera could not be opened.')
+            return
+        if info.object.pipeline.is_acquiring(info.object):
+            info.object.pipeline.start_acquisition(channel)
+
     def action_take_video(self, info):
         win = info.object
-        if win.acquisition_thread is not None \
-            and win.acquisition_thread.is_alive():
-            win.acquisition_thread.abort_flag = True
+        if win.pipeline.is_acquiring(win):
+            for channel in win.channels:
+                win.pipeline.stop_acquisition(channel)
         else:
-            win.acquisition_thread = AcquisitionThread(camera=win.camera,
-                queue=win.processing_queue)
-            win.acquisition_thread.start()
+            for channel in win.channels:
+                win.pipeline.start_acquisition(channel)
 
     def action_take_photo(self, info):
         win = info.object
-        win.camera.query_frame()
-        win.processing_queue.put(win.camera.frame, block=False)
+        for channel in win.channels:
+            win.pipeline.take_frame(channel)
 
     def closed(self, info, is_ok):
         win = info.object
-        # Shut down the threads
-        win.processing_thread.finish()
-        win.processing_thread.join()
-        if win.acquisition_thread is not None:
-            win.acquisition_thread.abort_flag = True
-            win.acquisition_thread.join()
+        win.status_timer.Stop()
+
+        # Shut down the threads and the cameras
+        win.pipeline.close()
+        for channel in win.extra_cameras:
+            channel.stop()
 
         # Shut down the camera
         win.camera.close()
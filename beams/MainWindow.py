@@ -1,15 +1,21 @@
 # coding: utf8
 
+import logging
 import sys
-import Queue as queue  # in Python 3: import queue
 from traits.api import (HasTraits, Instance, DelegatesTo, Button, Str, List,
-    Range)
+    Range, Enum, Any, Bool, Property)
 from traitsui.api import (View, HSplit, Tabbed, VGroup, Item, MenuBar,
     ToolBar, Action, Menu, EnumEditor, ListEditor, Group)
-from pyface.api import error
+from pyface.api import GUI, error
+from pyface.timer.api import Timer
 from chaco.api import gray, pink, jet
 
 from Camera import Camera, CameraError
+from CameraChannel import (CameraChannel, load_plugins, TRANSFORM_PLUGINS,
+    DISPLAY_PLUGINS, FRAME_POOL_SIZE)
+from FramePool import FramePool
+from FrameMailbox import POLICIES, DROP_OLDEST
+from FrameRecorder import FrameRecorder
 from MainHandler import MainHandler
 from CameraImage import CameraImage, bone
 from AwesomeColorMaps import awesome, isoluminant
@@ -17,11 +23,10 @@ from ColorMapEditor import ColorMapEditor
 from CameraDialog import CameraDialog
 from DisplayPlugin import DisplayPlugin
 from TransformPlugin import TransformPlugin
-from ProcessingThread import ProcessingThread
-from AcquisitionThread import AcquisitionThread
+from Pipeline import Pipeline
+from Schedule import Schedule
 from IconFinder import find_icon
-
-MAX_QUEUE_SIZE = 0  # i.e. infinite
+import Timing
 
 
 class MainWindow(HasTraits):
@@ -30,18 +35,40 @@ class MainWindow(HasTraits):
     # Current folder for file dialog
     _current_folder = None
 
+    # The main window's camera is the first channel
+    channel = 0
+
     camera = Instance(Camera)
     id_string = DelegatesTo('camera')
     resolution = DelegatesTo('camera')
+    roi = DelegatesTo('camera')
+    binning = DelegatesTo('camera')
     status = Str()
     screen = Instance(CameraImage, args=())
     cmap = DelegatesTo('screen')
     display_frame_rate = Range(1, 60, 15)
+    display_schedule = Instance(Schedule)
+    # How many frames may wait for processing, and what to do when more come
+    queue_length = Range(1, 16, 1)
+    queue_policy = Enum(DROP_OLDEST, POLICIES)
+    # Run the camera in a separate process, sending frames via shared memory
+    acquire_in_subprocess = Bool(False)
+    # Record only every Nth frame
+    record_every = Range(1, 100, 1)
+    # Run the analysis plugins on each frame at the same time
+    parallel_plugins = Bool(True)
+    # Show how long each stage of the pipeline takes on the screen
+    show_timing = Bool(False)
     transform_plugins = List(Instance(TransformPlugin))
     display_plugins = List(Instance(DisplayPlugin))
-    acquisition_thread = Instance(AcquisitionThread)  # default: None
-    processing_thread = Instance(ProcessingThread)  # default: None
-    processing_queue = Instance(queue.Queue, kw={'maxsize': MAX_QUEUE_SIZE})
+    acquisition_thread = Any()  # default: None
+    # Cameras that are acquired and analyzed along with the main one
+    extra_cameras = List(Instance(CameraChannel))
+    channels = Property(depends_on='extra_cameras')
+    pipeline = Instance(Pipeline)
+    recorder = Instance(FrameRecorder)  # default: None
+    frame_pool = Instance(FramePool, kw={'size': FRAME_POOL_SIZE})
+    status_timer = Any()
     cameras_dialog = Instance(CameraDialog, args=())
 
     # Actions
@@ -72,6 +99,15 @@ class MainWindow(HasTraits):
         tooltip='Start viewing the video feed from the camera',
         image=find_icon('camera-video'),
         action='action_take_video')
+    add_camera = Action(
+        name='&Add Camera...',
+        tooltip='Acquire from another camera at the same time',
+        action='action_add_camera')
+    record = Action(
+        name='&Record...',
+        style='toggle',
+        tooltip='Write all frames from the camera to a file',
+        action='action_record')
     take_photo = Action(
         name='Take &Photo',
         tooltip='Take one snapshot from the camera',
@@ -88,6 +124,8 @@ class MainWindow(HasTraits):
                         Item('id_string', style='readonly', label='Camera'),
                         Item('resolution', style='readonly',
                             format_str=u'%i \N{multiplication sign} %i'),
+                        Item('roi', label='ROI (x, y, w, h)'),
+                        Item('binning'),
                         Group(
                             Item('camera', show_label=False, style='custom'),
                             label='Camera properties',
@@ -107,6 +145,13 @@ class MainWindow(HasTraits):
                         Item('screen', show_label=False,
                             editor=ColorMapEditor(width=256)),
                         Item('display_frame_rate'),
+                        Item('queue_length'),
+                        Item('queue_policy', label='When queue is full'),
+                        Item('acquire_in_subprocess'),
+                        Item('record_every', label='Record every Nth frame'),
+                        Item('parallel_plugins',
+                            label='Run math plugins in parallel'),
+                        Item('show_timing', label='Show latencies'),
                         label='Video'),
                     # FIXME: mutable=False means the items can't be deleted,
                     # added, or rearranged, but we do actually want them to
@@ -116,7 +161,11 @@ class MainWindow(HasTraits):
                         label='Transform'),
                     VGroup(Item('display_plugins', show_label=False,
                         editor=ListEditor(style='custom', mutable=False)),
-                        label='Math')),
+                        label='Math'),
+                    VGroup(Item('extra_cameras', show_label=False,
+                        editor=ListEditor(use_notebook=True, deletable=True,
+                            page_name='.id_string')),
+                        label='More Cameras')),
                 Item('screen', show_label=False, width=640, height=480,
                     style='custom')),
             Item('status', style='readonly', show_label=False)),
@@ -126,7 +175,7 @@ class MainWindow(HasTraits):
             Menu('|', save, '_', quit, name='&File'),
             Menu(name='&Edit'),
             Menu(name='&View'),
-            Menu('|', choose_camera, name='&Camera'),
+            Menu('|', choose_camera, add_camera, record, name='&Camera'),
             Menu(name='&Math'),
             Menu(about, name='&Help')),
         toolbar=ToolBar('|', save, '_', take_photo, take_video),
@@ -138,21 +187,51 @@ class MainWindow(HasTraits):
         return self.view.handler.action_find_resolution(None)
 
     def _display_frame_rate_changed(self, value):
-        self.processing_thread.update_frequency = value
+        for channel in self.channels:
+            channel.display_schedule.rate = value
+
+    def _display_schedule_default(self):
+        return Schedule(rate=self.display_frame_rate)
+
+    def _queue_length_changed(self, value):
+        self.pipeline.mailbox.capacity = value
+
+    def _queue_policy_changed(self, value):
+        self.pipeline.mailbox.policy = value
+
+    def _acquire_in_subprocess_changed(self, value):
+        self.pipeline.acquire_in_subprocess = value
+
+    def _parallel_plugins_changed(self, value):
+        self.pipeline.parallel_plugins = value
+
+    def _show_timing_changed(self, value):
+        self.screen.hud('timing', Timing.report() if value else None)
+
+    def _recorder_changed(self, value):
+        self.pipeline.recorder = value
+
+    def _pipeline_default(self):
+        return Pipeline(queue_length=self.queue_length,
+            queue_policy=self.queue_policy,
+            show_frame=_show_frame)
 
     def _transform_plugins_default(self):
-        plugins = []
-        for name in ['Rotator', 'BackgroundSubtract']:
-            module = __import__(name, globals(), locals(), [name])
-            plugins.append(getattr(module, name)())
-        return plugins
+        return load_plugins(TRANSFORM_PLUGINS)
 
     def _display_plugins_default(self):
-        plugins = []
-        for name in ['BeamProfiler', 'MinMaxDisplay', 'DeltaDetector', 'Centroid']:
-            module = __import__(name, globals(), locals(), [name])
-            plugins.append(getattr(module, name)(screen=self.screen))
-        return plugins
+        return load_plugins(DISPLAY_PLUGINS, screen=self.screen)
+
+    def _get_channels(self):
+        return [self] + self.extra_cameras
+
+    def _extra_cameras_changed(self):
+        self.pipeline.channels = self.channels
+
+    def _extra_cameras_items_changed(self, event):
+        self.pipeline.channels = self.channels
+        for channel in event.removed:
+            channel.stop()
 
     def __init__(self, **traits):
         super(MainWindow, self).__init__(**traits)
@@ -161,8 +240,8 @@ class MainWindow(HasTraits):
         self.cameras_dialog.on_trait_change(self.on_cameras_response, 'closed')
         self.on_cameras_response()
 
-        self.processing_thread = ProcessingThread(self, self.processing_queue, self.display_frame_rate)
-        self.processing_thread.start()
+        self.pipeline.channels = self.channels
+        self.status_timer = Timer(1000, self.update_status)
 
     def on_cameras_response(self):
         plugin_obj = self.cameras_dialog.get_plugin_object()
@@ -185,7 +264,46 @@ class MainWindow(HasTraits):
         except CameraError:
             error(None, 'No camera was detected. Did you forget to plug it in?')
             sys.exit()
+        self.camera.frame_pool = self.frame_pool
+
+    def add_camera(self, plugin_obj):
+        """Starts using a camera of class @plugin_obj in addition."""
+        camera = plugin_obj()
+        camera.open()
+        channel = CameraChannel(camera=camera,
+            channel=max(c.channel for c in self.channels) + 1,
+            display_schedule=Schedule(rate=self.display_frame_rate))
+        self.extra_cameras.append(channel)
+        return channel
+
+    def update_status(self):
+        """Show the frame counters in the status bar."""
+        stats = self.pipeline.statistics()
+        self.status = ('Frames acquired: {acquired}, processed: {processed}, '
+            'dropped: {dropped}, latency: {latency:.0f} ms'.format(
+                latency=self.screen.latency * 1000.0, **stats))
+        if self.recorder is not None:
+            self.status += (' - recorded {0.frames_written}, '
+                'dropped {0.frames_dropped}'.format(self.recorder))
+        rates = ['{} {:.1f} Hz'.format(type(plugin).__name__,
+            plugin.achieved_rate)
+            for plugin in self.display_plugins if plugin.active]
+        if rates:
+            self.status += ' - ' + ', '.join(rates)
+        for channel in self.channels:
+            for plugin in channel.display_plugins:
+                plugin.update_achieved_rate()
+        if self.show_timing:
+            self.screen.hud('timing', Timing.report())
+
+
+def _show_frame(screen, frame):
+    # Called in a processing thread; the screen must be updated in the GUI's
+    # thread, so set the frame there
+    GUI.set_trait_later(screen, 'frame', frame)
+
 
 def main():
+    logging.basicConfig()  # errors in the plugins go to standard error
     mainwin = MainWindow()
     mainwin.configure_traits()
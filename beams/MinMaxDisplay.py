@@ -1,6 +1,6 @@
 from traits.api import Float
 from traitsui.api import View, Group, Item
-from DisplayPlugin import DisplayPlugin
+from DisplayPlugin import DisplayPlugin, SCHEDULE_GROUP
 
 
 class MinMaxDisplay(DisplayPlugin):
@@ -11,11 +11,14 @@ class MinMaxDisplay(DisplayPlugin):
     view = View(
         Group(
             Item('active'),
+            SCHEDULE_GROUP,
             label='Minimum-maximum',
             show_border=True))
 
     def __init__(self, **traits):
         super(MinMaxDisplay, self).__init__(**traits)
+        if self.screen is None:
+            return  # nothing to draw on
         self.on_trait_change(self._update_hud, '_minimum,_maximum',
             dispatch='ui')
 
@@ -24,9 +27,12 @@ class MinMaxDisplay(DisplayPlugin):
             'Minimum: {0._minimum}\n'
             'Maximum: {0._maximum}'.format(self))
 
-    def _process(self, frame):
-        self._minimum = frame.min()
-        self._maximum = frame.max()
+    def _process(self, context):
+        self._minimum = float(context.data.min())
+        self._maximum = float(context.data.max())
+
+    def results(self):
+        return {'minimum': self._minimum, 'maximum': self._maximum}
 
     def deactivate(self):
         self.screen.hud('minmax', None)
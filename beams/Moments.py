@@ -0,0 +1,108 @@
+"""
+Image moments of a beam, calculated without frame-sized temporary arrays.
+
+The moments up to second order, except the cross term, only depend on the
+row and column sums of the image (its projections on the axes), so they are
+calculated from those with 1-D index vectors. The cross term m11 takes one
+more pass over the image. A constant background can be subtracted
+analytically, so the image itself is never modified or copied.
+"""
+
+import numpy as N
+
+_index_vectors = {}
+
+
+def index_vector(length):
+    """Returns [0, 1, ..., @length - 1] as floats; cached, don't modify"""
+    try:
+        return _index_vectors[length]
+    except KeyError:
+        vector = N.arange(length, dtype=float)
+        vector.flags.writeable = False
+        return _index_vectors.setdefault(length, vector)
+
+
+def _accumulator(dtype):
+    # Sums of up to 16-bit integers are exact in 64-bit integers, and
+    # faster than converting every pixel to floating point
+    if dtype.kind in 'uib' and dtype.itemsize <= 2:
+        return N.int64 if dtype.kind == 'i' else N.uint64
+    return N.float64
+
+
+def projection(frame, axis):
+    """
+    Returns the sums of the 2-D array @frame along @axis (0 gives the column
+    sums, 1 the row sums) as a floating point array.
+    """
+    return frame.sum(axis=axis, dtype=_accumulator(frame.dtype)).astype(float)
+
+
+def projections(frame):
+    """Returns the column sums and the row sums of @frame"""
+    return projection(frame, 0), projection(frame, 1)
+
+
+def centroid_from_projections(columns, rows, background=0.0):
+    """
+    Returns the centroid (m10, m01) of an image whose column and row sums
+    are @columns and @rows, after subtracting @background from each pixel.
+    """
+    m00 = columns.sum() - background * columns.size * rows.size
+    m00 = m00 or 1.0
+    m10 = (columns.dot(index_vector(columns.size))
+        - background * rows.size * _sum_of_indices(columns.size)) / m00
+    m01 = (rows.dot(index_vector(rows.size))
+        - background * columns.size * _sum_of_indices(rows.size)) / m00
+    return m10, m01
+
+
+def moments_from_projections(columns, rows, background=0.0):
+    """
+    Returns the moments m00, m10, m01, m20, m02 of an image whose column and
+    row sums are @columns and @rows, after subtracting @background from each
+    pixel; normalized like calculate_moments(). These are all the moments up
+    to second order except the cross term.
+    """
+    width, height = columns.size, rows.size
+    x, y = index_vector(width), index_vector(height)
+
+    # Projections of the image minus the background
+    columns = columns - background * height
+    rows = rows - background * width
+
+    m00 = columns.sum() or 1.0
+    m10 = columns.dot(x) / m00
+    m01 = rows.dot(y) / m00
+    dx, dy = x - m10, y - m01
+    m20 = columns.dot(dx * dx) / m00
+    m02 = rows.dot(dy * dy) / m00
+    return m00, m10, m01, m20, m02
+
+
+def calculate_moments(frame, background=0.0, frame_projections=None):
+    """
+    Returns the moments m00, m10, m01, m20, m02, m11 of @frame minus
+    @background, normalized by m00 and with the second moments about the
+    centroid. @frame_projections are the (columns, rows) sums of @frame, if
+    they were already calculated.
+    """
+    if frame_projections is None:
+        frame_projections = projections(frame)
+    columns, rows = frame_projections
+    m00, m10, m01, m20, m02 = moments_from_projections(columns, rows,
+        background)
+    height, width = frame.shape
+    dx = index_vector(width) - m10
+    dy = index_vector(height) - m01
+
+    # Cross term: sum over rows of dy * (sum over the row of frame * dx).
+    # einsum converts the pixels to floating point in small chunks.
+    row_sums = N.einsum('ij,j->i', frame, dx, dtype=float, casting='safe')
+    m11 = (row_sums.dot(dy) - background * dx.sum() * dy.sum()) / m00
+    return m00, m10, m01, m20, m02, m11
+
+
+def _sum_of_indices(length):
+    return length * (length - 1) / 2.0
@@ -0,0 +1,170 @@
+import numpy as N
+from scipy import ndimage
+from traits.api import Int, Float, Range, Array
+from traitsui.api import View, VGroup, Item
+from enable.api import ColorTrait
+from DisplayPlugin import DisplayPlugin, SCHEDULE_GROUP
+from Percentile import percentile
+
+# Columns of the spots array
+X, Y, MAJOR_AXIS, MINOR_AXIS, ANGLE, INTENSITY = range(6)
+
+
+class MultiSpot(DisplayPlugin):
+    """
+    Finds all the separate spots in the image, such as the beams from a
+    fiber array, and profiles each one: the pixels above a threshold are
+    split into connected regions, and the moments of all regions are
+    calculated together.
+    """
+
+    background_percentile = Range(0.0, 100.0, 15.0)
+    # Pixels belong to a spot if they are this fraction of the way from the
+    # background to the brightest pixel
+    threshold = Range(0.0, 1.0, 0.25)
+    # Smaller regions are taken to be noise
+    min_pixels = Range(1, 1000, 4)
+
+    # One row per spot, with the columns X, Y, MAJOR_AXIS, etc.
+    _spots = Array()
+    _baseline = Float()
+
+    # These control the visualization
+    num_points = Int(40)
+    color = ColorTrait('white')
+
+    view = View(
+        VGroup(
+            Item('active'),
+            Item('background_percentile'),
+            Item('threshold'),
+            Item('min_pixels', label='Minimum spot size'),
+            SCHEDULE_GROUP,
+            label='Multiple Spots',
+            show_border=True))
+
+    def __init__(self, **traits):
+        super(MultiSpot, self).__init__(**traits)
+        self._spots = N.zeros((0, 6))
+        if self.screen is None:
+            return  # nothing to draw on
+        self.screen.data_store['spots_x'] = N.array([])
+        self.screen.data_store['spots_y'] = N.array([])
+        self.screen.data_store['spot_ellipses_x'] = N.array([])
+        self.screen.data_store['spot_ellipses_y'] = N.array([])
+        renderers = self.screen.plot.plot(('spots_x', 'spots_y'),
+            type='scatter',
+            marker_size=2.0,
+            color=self.color,
+            marker='circle')
+        self._centroid_patch = renderers[0]
+        self._centroid_patch.visible = self.active
+        renderers = self.screen.plot.plot(
+            ('spot_ellipses_x', 'spot_ellipses_y'),
+            type='line',
+            color=self.color)
+        self._ellipse_patch = renderers[0]
+        self._ellipse_patch.visible = self.active
+
+        # Connect handlers
+        self.on_trait_change(self._redraw, '_spots', dispatch='ui')
+
+    def _redraw(self):
+        spots = self._spots
+        self.screen.data_store['spots_x'] = spots[:, X]
+        self.screen.data_store['spots_y'] = spots[:, Y]
+
+        # All the ellipses in one line plot, separated by NaN so that they
+        # are not connected to each other
+        t = N.linspace(0, 2 * N.pi, self.num_points)
+        sin_t, cos_t = N.sin(t), N.cos(t)
+        angle = N.radians(spots[:, ANGLE, N.newaxis])
+        sin_angle, cos_angle = N.sin(angle), N.cos(angle)
+        r_a = spots[:, MAJOR_AXIS, N.newaxis] / 2.0
+        r_b = spots[:, MINOR_AXIS, N.newaxis] / 2.0
+        x = (spots[:, X, N.newaxis]
+            + r_a * cos_t * cos_angle - r_b * sin_t * sin_angle)
+        y = (spots[:, Y, N.newaxis]
+            + r_a * cos_t * sin_angle + r_b * sin_t * cos_angle)
+        gap = N.empty((len(spots), 1))
+        gap.fill(N.nan)
+        self.screen.data_store['spot_ellipses_x'] = N.hstack((x, gap)).ravel()
+        self.screen.data_store['spot_ellipses_y'] = N.hstack((y, gap)).ravel()
+
+        self.screen.hud('multispot', 'Spots: {}'.format(len(spots)))
+
+    def _process(self, context):
+        if context.is_monochrome:
+            frame = context.data
+        else:
+            frame = context.gray
+
+        histogram = context.histogram
+        background = percentile(frame, self.background_percentile,
+            histogram)
+        # The histogram ends at the brightest pixel
+        maximum = frame.max() if histogram is None else len(histogram) - 1
+        mask = frame > background + self.threshold * (maximum - background)
+
+        labels, count = ndimage.label(mask)
+        pixels, m00, m10, m01, m20, m02, m11 = spot_moments(frame, mask,
+            labels[mask], count, background)
+        keep = (pixels >= self.min_pixels) & (m00 > 0)
+        m00, m10, m01, m20, m02, m11 = (moment[keep]
+            for moment in (m00, m10, m01, m20, m02, m11))
+
+        spots = N.empty((len(m00), 6))
+        q = N.sqrt((m20 - m02) ** 2 + 4 * m11 ** 2)
+        spots[:, X] = m10
+        spots[:, Y] = m01
+        spots[:, MAJOR_AXIS] = 2 ** 1.5 * N.sqrt(m20 + m02 + q)
+        spots[:, MINOR_AXIS] = 2 ** 1.5 * N.sqrt(N.maximum(m20 + m02 - q, 0))
+        spots[:, ANGLE] = N.degrees(0.5 * N.arctan2(2 * m11, m20 - m02))
+        spots[:, INTENSITY] = m00
+        self._baseline = background
+        self._spots = spots
+
+    def results(self):
+        result = {'count': len(self._spots), 'baseline': self._baseline}
+        names = ('centroid_x', 'centroid_y', 'major_axis', 'minor_axis',
+            'angle', 'intensity')
+        for index, spot in enumerate(self._spots):
+            for name, value in zip(names, spot):
+                result['spot{}_{}'.format(index, name)] = float(value)
+        return result
+
+    def activate(self):
+        self._centroid_patch.visible = self._ellipse_patch.visible = True
+
+    def deactivate(self):
+        self.screen.hud('multispot', None)
+        self._centroid_patch.visible = self._ellipse_patch.visible = False
+
+
+def spot_moments(frame, mask, spot_labels, count, background=0.0):
+    """
+    Calculates the moments of each spot in @frame at once. @mask selects the
+    pixels that belong to a spot, @spot_labels are the numbers (1 to
+    @count) of the spots those pixels belong to, and @background is
+    subtracted from each pixel. Returns arrays with, for each spot, the
+    number of pixels and the moments m00, m10, m01, m20, m02, m11; the
+    first and second moments are normalized and about the centroid, like
+    those of Moments.calculate_moments().
+    """
+    y, x = N.nonzero(mask)
+    weights = frame[mask] - float(background)
+    length = count + 1  # label 0 is the pixels outside the spots
+
+    def total(values=None):
+        return N.bincount(spot_labels, values, minlength=length)[1:]
+
+    pixels = total()
+    m00 = total(weights)
+    normalization = N.where(m00 == 0, 1.0, m00)
+    wx, wy = weights * x, weights * y
+    m10 = total(wx) / normalization
+    m01 = total(wy) / normalization
+    m20 = total(wx * x) / normalization - m10 ** 2
+    m02 = total(wy * y) / normalization - m01 ** 2
+    m11 = total(wx * y) / normalization - m10 * m01
+    return pixels, m00, m10, m01, m20, m02, m11
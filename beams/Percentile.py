@@ -0,0 +1,50 @@
+"""
+Percentiles of camera images. For images of 8- or 16-bit unsigned integers,
+which is what most cameras give, the percentile is looked up in a histogram
+of the pixel values, which is much faster than N.percentile's partial sort
+and gives the same result.
+"""
+
+import numpy as N
+
+
+def has_histogram(frame):
+    """Whether percentile() can use a histogram for the array @frame"""
+    return frame.dtype.kind == 'u' and frame.dtype.itemsize <= 2
+
+
+def histogram(frame):
+    """Number of pixels with each value in @frame, an integer image"""
+    return N.bincount(frame.ravel())
+
+
+def percentile(frame, q, frame_histogram=None):
+    """
+    Returns the @q'th percentile of the values in @frame, interpolated
+    linearly like N.percentile() does. @frame_histogram is the histogram of
+    @frame if it was already calculated.
+    """
+    if frame_histogram is None:
+        if not has_histogram(frame):
+            return N.percentile(frame, q)
+        frame_histogram = histogram(frame)
+    return histogram_percentile(frame_histogram, q)
+
+
+def histogram_percentile(counts, q):
+    """
+    Returns the @q'th percentile of values whose histogram is @counts, where
+    @counts[v] is the number of times the value v occurs.
+    """
+    cumulative = N.cumsum(counts)
+    total = cumulative[-1]
+    if total == 0:
+        raise ValueError('percentile of an empty image')
+    # Position of the percentile in the sorted values, as N.percentile
+    position = q / 100.0 * (total - 1)
+    below = int(position)
+    above = min(below + 1, total - 1)
+    # The k'th sorted value is the first value with more than k pixels at
+    # or below it
+    low, high = N.searchsorted(cumulative, [below, above], side='right')
+    return low + (high - low) * (position - below)
@@ -0,0 +1,123 @@
+import multiprocessing
+
+from AcquisitionThread import AcquisitionThread
+from FrameMailbox import FrameMailbox, DROP_OLDEST
+from PluginPool import PluginPool
+from ProcessAcquisition import ProcessAcquisitionThread
+from ProcessingThread import ProcessingThread
+
+# Frames from several cameras can be processed in parallel
+NUM_PROCESSING_THREADS = multiprocessing.cpu_count()
+# Threads that run the analysis plugins on one frame at the same time
+NUM_PLUGIN_THREADS = multiprocessing.cpu_count()
+
+
+class Pipeline(object):
+    """
+    Takes frames from the cameras and runs them through the transform and
+    analysis plugins, independent of any user interface. The main window and
+    the headless command line program both use this.
+
+    @channels is a list of camera channels, objects with the attributes
+    'channel' (number that the frames are tagged with), 'camera',
+    'transform_plugins', 'display_plugins', 'display_schedule',
+    'acquisition_thread' and 'screen'. If 'screen' is not None, frames are
+    passed to @show_frame(screen, frame) when the display schedule says so.
+    After each frame is analyzed, @on_results(channel, frame, results) is
+    called in the processing thread, where @results is a list of
+    (plugin, plugin.results()) for the plugins that analyzed the frame.
+    """
+
+    def __init__(self, channels=(), queue_length=1, queue_policy=DROP_OLDEST,
+            num_threads=NUM_PROCESSING_THREADS,
+            num_plugin_threads=NUM_PLUGIN_THREADS, show_frame=None,
+            on_results=None):
+        self.channels = list(channels)
+        self.show_frame = show_frame
+        self.on_results = on_results
+        self.recorder = None  # records the frames of channel 0 if set
+        self.parallel_plugins = True
+        self.acquire_in_subprocess = False
+        self.mailbox = FrameMailbox(capacity=queue_length,
+            policy=queue_policy,
+            on_drop=self.release_frame,
+            on_put=self._record)
+        self.plugin_pool = PluginPool(num_plugin_threads)
+        self._threads = [ProcessingThread(self, self.mailbox)
+            for count in range(max(1, num_threads))]
+        for thread in self._threads:
+            thread.start()
+
+    def start_acquisition(self, channel):
+        """Starts taking frames continuously from the camera of @channel."""
+        if self.acquire_in_subprocess:
+            thread_class = ProcessAcquisitionThread
+        else:
+            thread_class = AcquisitionThread
+        channel.acquisition_thread = thread_class(camera=channel.camera,
+            mailbox=self.mailbox, channel=channel.channel)
+        channel.acquisition_thread.start()
+
+    def stop_acquisition(self, channel, wait=False):
+        """
+        Stops taking frames from the camera of @channel, waiting for the
+        acquisition thread to finish if @wait is True.
+        """
+        thread = channel.acquisition_thread
+        if thread is None:
+            return
+        thread.abort_flag = True
+        if wait:
+            thread.join()
+            channel.acquisition_thread = None
+
+    def is_acquiring(self, channel):
+        thread = channel.acquisition_thread
+        return thread is not None and thread.is_alive()
+
+    def take_frame(self, channel):
+        """Takes one frame from the camera of @channel and processes it."""
+        frame = channel.camera.grab()
+        frame.channel = channel.channel
+        self.mailbox.put(frame)
+
+    def get_channel(self, number):
+        """Returns the camera channel that frames tagged @number came from."""
+        for channel in self.channels:
+            if channel.channel == number:
+                return channel
+        return None
+
+    def release_frame(self, frame):
+        """Called by the pipeline when it is done with a camera frame."""
+        frame.release()
+
+    def _record(self, frame):
+        # Called in the acquisition thread for every frame, so that frames
+        # that are dropped because the analysis can't keep up are still
+        # recorded; the recorder copies the frame and doesn't block
+        recorder = self.recorder
+        if recorder is not None and frame.channel == 0:
+            recorder.write(frame)
+
+    def statistics(self):
+        """Returns a dict of the frame counters."""
+        return self.mailbox.statistics()
+
+    def close(self):
+        """
+        Stops acquisition and processing, and closes the recorder. The
+        cameras are not closed.
+        """
+        # Acquisition first, since it may be waiting for the processing
+        # threads to hand back a frame buffer.
+        for channel in self.channels:
+            self.stop_acquisition(channel, wait=True)
+        for thread in self._threads:
+            thread.finish()
+        for thread in self._threads:
+            thread.join()
+        self.plugin_pool.close()
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
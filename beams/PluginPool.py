@@ -0,0 +1,91 @@
+import threading
+import Queue as queue  # in Python 3: import queue
+
+
+class PluginPool(object):
+    """
+    A fixed set of worker threads that runs one function on many items at
+    once. Meant for the analysis plugins, whose NumPy work releases the GIL,
+    so that one frame can be analyzed by all plugins at the same time.
+
+        batch = pool.start(function, items)
+        ...  # do other work in this thread
+        batch.wait()  # returns when function has run on all items
+    """
+
+    def __init__(self, num_workers):
+        self._tasks = queue.Queue()
+        self._workers = []
+        for count in range(max(1, num_workers)):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def start(self, function, items):
+        """
+        Calls @function on each of @items in the worker threads, and returns
+        a Batch to wait for the calls to finish.
+        """
+        items = list(items)
+        batch = Batch(len(items))
+        for item in items:
+            self._tasks.put((function, item, batch))
+        return batch
+
+    def map(self, function, items):
+        """Calls @function on each of @items and waits until all are done."""
+        self.start(function, items).wait()
+
+    def close(self):
+        """Stops the worker threads after they finish the waiting tasks."""
+        for worker in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    @property
+    def num_workers(self):
+        return len(self._workers)
+
+    def _work(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                break
+            function, item, batch = task
+            try:
+                function(item)
+            except Exception as e:
+                batch._done(e)
+            else:
+                batch._done(None)
+
+
+class Batch(object):
+    """The calls started by one PluginPool.start()"""
+
+    def __init__(self, count):
+        self._remaining = count
+        self._error = None
+        self._condition = threading.Condition()
+
+    def wait(self):
+        """
+        Waits until all calls have finished. If any of them raised an
+        exception, the first one is raised again here.
+        """
+        with self._condition:
+            while self._remaining > 0:
+                self._condition.wait()
+        if self._error is not None:
+            raise self._error
+
+    def _done(self, error):
+        with self._condition:
+            self._remaining -= 1
+            if self._error is None:
+                self._error = error
+            if self._remaining == 0:
+                self._condition.notify_all()
@@ -0,0 +1,134 @@
+import numpy as N
+from traits.api import Range, Enum, Button, Int, Float
+from traitsui.api import View, VGroup, Item
+from DisplayPlugin import (DisplayPlugin, SCHEDULE_GROUP, SCHEDULES,
+    EVERY_FRAME)
+from Moments import moments_from_projections
+from Percentile import percentile
+from Statistics import RunningStatistics, AllanDeviation
+
+# The quantities whose stability is measured
+QUANTITIES = ('centroid_x', 'centroid_y', 'width_x', 'width_y')
+ALLAN_LAGS = 8
+ALLAN_LEVELS = 20  # up to 8 * 2^19 frames, more than 11 hours at 100 fps
+HUD_OCTAVES = 3  # show the Allan deviation at every this many octaves
+
+
+class PointingStability(DisplayPlugin):
+    """
+    Statistics of the beam position and width over time: the mean, standard
+    deviation, minimum and maximum, and the Allan deviation of the position
+    at averaging times of 1, 2, 4, ... frames. Only a fixed amount of
+    memory is used, however long it runs.
+
+    The widths are the D4sigma widths along the x and y axes, which only
+    need the projections of the image that are shared with other plugins.
+    The Allan deviation treats the analyzed frames as evenly spaced; the
+    averaging times in seconds are based on the average frame interval.
+    """
+
+    background_percentile = Range(0.0, 100.0, 15.0)
+    reset = Button()
+
+    # Statistics need every frame, and are cheap
+    schedule = Enum(EVERY_FRAME, SCHEDULES)
+
+    _count = Int()
+    _skipped = Int()  # frames without a meaningful width
+    _interval = Float()  # average time between analyzed frames
+
+    view = View(
+        VGroup(
+            Item('active'),
+            Item('background_percentile'),
+            Item('reset', show_label=False),
+            SCHEDULE_GROUP,
+            label='Pointing Stability',
+            show_border=True))
+
+    def __init__(self, **traits):
+        self._statistics = RunningStatistics(len(QUANTITIES))
+        self._allan = AllanDeviation(2, ALLAN_LAGS, ALLAN_LEVELS)
+        self._first_timestamp = None
+        self._reset_requested = False
+        super(PointingStability, self).__init__(**traits)
+        if self.screen is None:
+            return  # nothing to draw on
+        self.on_trait_change(self._update_hud, '_count', dispatch='ui')
+
+    def _reset_fired(self):
+        # Reset in the processing thread, not halfway through a frame
+        self._reset_requested = True
+
+    def _process(self, context):
+        if self._reset_requested:
+            self._reset_requested = False
+            self._statistics.reset()
+            self._allan.reset()
+            self._first_timestamp = None
+            self._skipped = 0
+
+        if context.is_monochrome:
+            frame = context.data
+        else:
+            frame = context.gray
+        background = percentile(frame, self.background_percentile,
+            context.histogram)
+        m00, m10, m01, m20, m02 = moments_from_projections(
+            context.column_projection, context.row_projection, background)
+        if not (m00 > 0 and m20 >= 0 and m02 >= 0):
+            # Mostly noise after subtracting the background, so there is no
+            # width; a single NaN would spoil all the statistics for good
+            self._skipped += 1
+            return
+        sample = N.array([m10, m01, 4 * N.sqrt(m20), 4 * N.sqrt(m02)])
+        self._statistics.add(sample)
+        self._allan.add(sample[:2])
+
+        timestamp = context.frame.timestamp
+        if self._first_timestamp is None:
+            self._first_timestamp = timestamp
+        elif self._statistics.count > 1:
+            self._interval = ((timestamp - self._first_timestamp)
+                / (self._statistics.count - 1))
+        self._count = self._statistics.count
+
+    def results(self):
+        statistics = self._statistics
+        result = {'count': statistics.count, 'skipped': self._skipped}
+        for values, suffix in ((statistics.mean, 'mean'),
+                (statistics.std, 'std'), (statistics.minimum, 'min'),
+                (statistics.maximum, 'max')):
+            for name, value in zip(QUANTITIES, values):
+                result['{}_{}'.format(name, suffix)] = float(value)
+        taus, deviations = self._allan.deviations()
+        for tau, (x, y) in zip(taus, deviations):
+            result['allan_x_{:d}'.format(int(tau))] = float(x)
+            result['allan_y_{:d}'.format(int(tau))] = float(y)
+        return result
+
+    def _update_hud(self):
+        statistics = self._statistics
+        mean, std = statistics.mean, statistics.std
+        spread = statistics.maximum - statistics.minimum
+        lines = [
+            'Frames: {} ({} skipped)'.format(statistics.count,
+                self._skipped),
+            u'Centroid: {:.2f} \xb1 {:.2f}, {:.2f} \xb1 {:.2f}'.format(
+                mean[0], std[0], mean[1], std[1]),
+            u'Width: {:.2f} \xb1 {:.2f}, {:.2f} \xb1 {:.2f}'.format(
+                mean[2], std[2], mean[3], std[3]),
+            'Peak to peak: {:.2f}, {:.2f}'.format(spread[0], spread[1]),
+        ]
+        taus, deviations = self._allan.deviations()
+        rows = [(tau, x, y)
+            for tau, (x, y) in list(zip(taus, deviations))[::HUD_OCTAVES]
+            if not N.isnan(x)]
+        if rows:
+            lines.append('Allan deviation:')
+            lines += ['  {:.3g} s: {:.3f}, {:.3f}'.format(
+                tau * self._interval, x, y) for tau, x, y in rows]
+        self.screen.hud('stability', '\n'.join(lines))
+
+    def deactivate(self):
+        self.screen.hud('stability', None)
@@ -0,0 +1,234 @@
+import multiprocessing
+import threading
+import time
+import Queue as queue  # in Python 3: import queue
+import numpy as N
+
+from FramePool import FramePool
+from Frame import Frame
+
+
+class SharedFrameRing(object):
+    """
+    A ring of frame buffers in shared memory. The camera process fills the
+    slots and the main process maps them as ordinary arrays, so frames cross
+    the process boundary without being copied. Slots that the main process
+    is done with are handed back to the camera process with release().
+    """
+
+    def __init__(self, shape, dtype, size=8):
+        self.shape = tuple(shape)
+        self.dtype = N.dtype(dtype)
+        self.size = size
+        self._raw = multiprocessing.RawArray('b', _nbytes(shape, dtype) * size)
+        self.buffers = _map_buffers(self._raw, self.shape, self.dtype, size)
+        self._slots = dict((id(b), ix) for ix, b in enumerate(self.buffers))
+        self._lock = threading.Lock()
+        self._outstanding = set()
+        self.free_slots = multiprocessing.Queue()
+        self.ready_slots = multiprocessing.Queue()
+        for ix in range(size):
+            self.free_slots.put(ix)
+
+    def take(self, index):
+        """Returns the buffer of a slot that the camera process filled."""
+        with self._lock:
+            self._outstanding.add(index)
+        return self.buffers[index]
+
+    def release(self, buffer):
+        """Hands a buffer back to the camera process. Others are ignored."""
+        index = self._slots.get(id(buffer))
+        if index is None or self.buffers[index] is not buffer:
+            return
+        with self._lock:
+            if index not in self._outstanding:
+                return
+            self._outstanding.discard(index)
+        self.free_slots.put(index)
+
+
+class _SlotPool(FramePool):
+    """
+    Frame pool used in the camera process, which hands out the shared memory
+    slot that the next frame should be written to.
+    """
+
+    def __init__(self):
+        super(_SlotPool, self).__init__(size=2)
+        self.next_buffer = None
+
+    def acquire(self, shape, dtype, block=True, timeout=None):
+        buffer = self.next_buffer
+        if (buffer is None or buffer.shape != tuple(shape)
+                or buffer.dtype != N.dtype(dtype)):
+            # The frame will be cropped or binned before it goes into the
+            # slot, so use ordinary pool buffers for the raw frame
+            return super(_SlotPool, self).acquire(shape, dtype, block,
+                timeout)
+        return buffer
+
+
+class ProcessAcquisitionThread(threading.Thread):
+    """
+    Drop-in replacement for AcquisitionThread that runs the camera in a child
+    process, so that the camera loop does not compete for the interpreter
+    lock with the processing thread and the GUI.
+
+    The camera object passed in is used to find the frame size and is closed
+    while the child process has its own copy of the camera open. It is
+    reopened when acquisition stops.
+    """
+
+    def __init__(self, camera, mailbox, channel=0, num_buffers=8):
+        super(ProcessAcquisitionThread, self).__init__()
+        self.abort_flag = False
+        self.camera = camera
+        self.mailbox = mailbox
+        self.channel = channel
+        self.num_buffers = num_buffers
+
+        # Find out what the frames look like
+        frame = camera.grab()
+        self.ring = SharedFrameRing(frame.shape, frame.dtype, num_buffers)
+        frame.release()
+
+    def run(self):
+        stop_event = multiprocessing.Event()
+        process = multiprocessing.Process(target=_acquisition_main,
+            args=(type(self.camera), _camera_state(self.camera),
+                self.ring._raw, self.ring.shape, self.ring.dtype.str,
+                self.ring.size, self.ring.free_slots, self.ring.ready_slots,
+                stop_event))
+        process.daemon = True
+
+        self.camera.close()
+        process.start()
+        try:
+            while not self.abort_flag and process.is_alive():
+                try:
+                    index, info = self.ring.ready_slots.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                self.mailbox.put(Frame(self.ring.take(index),
+                    channel=self.channel, pool=self.ring, **info))
+        finally:
+            stop_event.set()
+            process.join(1.0)
+            if process.is_alive():
+                process.terminate()
+            self.camera.open()
+
+
+def _nbytes(shape, dtype):
+    return int(N.prod(shape)) * N.dtype(dtype).itemsize
+
+
+def _map_buffers(raw, shape, dtype, size):
+    """Views the shared memory block as @size arrays"""
+    count = int(N.prod(shape))
+    nbytes = _nbytes(shape, dtype)
+    return [N.frombuffer(raw, dtype=dtype, count=count,
+        offset=ix * nbytes).reshape(shape) for ix in range(size)]
+
+
+def _camera_state(camera):
+    """The camera settings that have to be copied to the child process"""
+    names = [name for name in camera.copyable_trait_names()
+        if name != 'frame'
+        and camera.trait(name).type not in ('property', 'constant', 'event')]
+    return camera.trait_get(names)
+
+
+def _acquisition_main(camera_class, state, raw, shape, dtype, size,
+        free_slots, ready_slots, stop_event):
+    """Main function of the camera process"""
+    buffers = _map_buffers(raw, shape, N.dtype(dtype), size)
+
+    camera = camera_class()
+    # Set the resolution first; other settings may be limited by it
+    if 'resolution' in state:
+        camera.resolution = state.pop('resolution')
+    camera.trait_set(**state)
+    pool = _SlotPool()
+    camera.frame_pool = pool
+
+    with camera:
+        while not stop_event.is_set():
+            try:
+                index = free_slots.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            buffer = pool.next_buffer = buffers[index]
+            frame = camera.grab()
+            if frame.data is not buffer:
+                # Driver doesn't fill frames in place, or the frame was
+                # cropped or binned
+                if frame.shape == buffer.shape:
+                    buffer[...] = frame.data
+                frame.release()
+                if frame.shape != buffer.shape:
+                    free_slots.put(index)
+                    continue
+            ready_slots.put((index, dict(sequence=frame.sequence,
+                timestamp=frame.timestamp, exposure=frame.exposure,
+                roi=frame.roi, source=frame.source)))
+
+
+def _benchmark(in_subprocess, seconds=5.0, busy=True):
+    """
+    Runs the dummy camera as fast as it goes, optionally while the main
+    process is kept busy, and returns the mean and standard deviation of the
+    time between frames in milliseconds.
+    """
+    from DummyGaussian import DummyGaussian
+    from FrameMailbox import FrameMailbox
+    from AcquisitionThread import AcquisitionThread
+
+    pool = FramePool(8)
+    camera = DummyGaussian(frame_rate=500, frame_pool=pool)
+    camera.open()
+    arrivals = []
+
+    if in_subprocess:
+        thread = ProcessAcquisitionThread(camera, None)
+    else:
+        thread = AcquisitionThread(camera, None)
+    mailbox = thread.mailbox = FrameMailbox(capacity=8,
+        on_drop=lambda frame: frame.release())
+
+    def consume():
+        while True:
+            frame = mailbox.get()
+            if frame is None:
+                break
+            arrivals.append(frame.timestamp)
+            frame.release()
+            mailbox.mark_processed(frame)
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    thread.start()
+
+    # Keep the interpreter busy with pure Python work, like a GUI would
+    end = time.time() + seconds
+    while time.time() < end:
+        if busy:
+            sum(ix * ix for ix in range(10000))
+        else:
+            time.sleep(0.01)
+
+    thread.abort_flag = True
+    thread.join()
+    mailbox.close()
+    consumer.join()
+    camera.close()
+
+    intervals = N.diff(arrivals) * 1000.0
+    return intervals.mean(), intervals.std()
+
+
+if __name__ == '__main__':
+    for in_subprocess in (False, True):
+        mean, std = _benchmark(in_subprocess)
+        print('{}: {:.2f} ms between frames, jitter {:.2f} ms'.format(
+            'subprocess' if in_subprocess else 'thread', mean, std))
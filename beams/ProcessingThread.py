@@ -1,40 +1,103 @@
+import logging
 import threading
-import time
-from pyface.api import GUI
+
+from Frame import clock
+from FrameContext import FrameContext
+from Timing import get_histogram
+from TransformPlugin import apply_transforms
+
+logger = logging.getLogger(__name__)
 
 
 class ProcessingThread(threading.Thread):
 
-    def __init__(self, controller, queue, update_frequency):
+    def __init__(self, controller, mailbox):
         super(ProcessingThread, self).__init__()
         self.abort_flag = False
         self.controller = controller
-        self.queue = queue
-        self.update_frequency = update_frequency
+        self.mailbox = mailbox
 
     def run(self):
         while True:
-            frame = self.queue.get()  # blocks until a frame is available
-            if self.abort_flag:
+            start = clock()
+            raw_frame = self.mailbox.get()  # blocks until a frame is available
+            get_histogram('mailbox wait').add(clock() - start)
+            if self.abort_flag or raw_frame is None:
                 break
-            if self.queue.qsize() > 2:
-                continue  # drop frame if there is a backlog
 
-            # Do any transformations on the frame
-            for plugin in self.controller.transform_plugins:
-                frame = plugin.process_frame(frame)
+            try:
+                self._process(raw_frame)
+            except Exception:
+                # One bad frame or plugin must not stop the processing
+                logger.exception('Error processing frame %s of camera %s',
+                    raw_frame.sequence, raw_frame.channel)
+            finally:
+                # Give the buffer back to the camera
+                self.controller.release_frame(raw_frame)
+
+                # Only now can another thread take this camera's next frame
+                self.mailbox.mark_processed(raw_frame)
+
+    def _process(self, raw_frame):
+        # Find the camera that the frame came from
+        channel = self.controller.get_channel(raw_frame.channel)
+        if channel is None:  # camera was removed
+            return
+
+        # Do any transformations on the frame
+        frame = apply_transforms(channel.transform_plugins, raw_frame)
+
+        # Quantities derived from the frame are shared by the screen and all
+        # the analysis plugins
+        context = FrameContext(frame)
+
+        # Display the frame on screen, if it's time to
+        display_due = channel.display_schedule.due()
+        if (display_due and channel.screen is not None
+                and self.controller.show_frame is not None):
+            self._display(channel.screen, context)
+
+        # Send the frame to the analysis components
+        plugins = self._analyze(channel.display_plugins, context, display_due)
+        on_results = self.controller.on_results
+        if on_results is not None:
+            on_results(channel, frame, [(plugin, plugin.results())
+                for plugin in plugins if plugin.current_frame is frame])
 
-            # Display the frame on screen
-            GUI.set_trait_later(self.controller.screen, 'data', frame)
+    def _display(self, screen, context):
+        # The screen holds on to the array after we are done, so it can't be
+        # one of the camera's or the transform plugins' buffers.
+        frame = context.frame
+        if screen.cmap is not None and not context.is_monochrome:
+            # The screen would convert it to grayscale anyway
+            frame = frame.derive(context.gray)
+        else:
+            frame = frame.derive(frame.data.copy())
+        self.controller.show_frame(screen, frame)
 
-            # Send the frame to the analysis components
-            for plugin in self.controller.display_plugins:
-                plugin.process_frame(frame)
+    def _analyze(self, plugins, context, display_due):
+        """Runs the active plugins on the frame, and returns them."""
+        plugins = [plugin for plugin in plugins if plugin.active]
+        pool = self.controller.plugin_pool
+        if pool is None or not self.controller.parallel_plugins:
+            for plugin in plugins:
+                plugin.process_frame(context, display_due)
+            return plugins
 
-            time.sleep(1.0 / self.update_frequency)
+        # Run the plugins that allow it in the pool, the others here in the
+        # meantime, and wait for all of them before going on to the next frame
+        batch = pool.start(
+            lambda plugin: plugin.process_frame(context, display_due),
+            [plugin for plugin in plugins if plugin.thread_safe])
+        try:
+            for plugin in plugins:
+                if not plugin.thread_safe:
+                    plugin.process_frame(context, display_due)
+        finally:
+            batch.wait()
+        return plugins
 
     def finish(self):
         """Signal the thread to stop."""
         self.abort_flag = True
-        self.queue.put(None, block=False)
-        # push fake data down the pipe in case it's waiting for data
+        self.mailbox.close()  # wakes the thread if it's waiting for data
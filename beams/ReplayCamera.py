@@ -0,0 +1,200 @@
+import json
+import os.path
+import numpy as N
+from traits.api import File, Enum, Bool, Int
+from traitsui.api import View, Item, HGroup, Label
+
+from Camera import Camera, CameraError
+
+
+class ReplayCamera(Camera):
+    '''
+    Plays back recorded frames from a file, without reading the whole file
+    into memory. Supported formats:
+
+    - NumPy .npy files containing a stack of frames (frames, height, width)
+      or (frames, height, width, channels), or a single frame
+    - raw files of frames stored one after another, described by a JSON
+      header with the same name and the extension .json, with the keys
+      "width", "height", "dtype" (default "uint16"), "channels" (default 1)
+      and optionally "header_bytes" and "frame_rate"
+    - uncompressed multi-page TIFF files
+    '''
+
+    plugin_info = {
+        'name': 'Replay',
+        'description': 'Play back recorded frames from a file',
+        'author': 'Philip Chimento',
+        'copyright year': '2013',
+    }
+
+    path = File(filter=['*.npy', '*.raw', '*.tif', '*.tiff'], exists=True)
+    playback = Enum('real time', 'as fast as possible')
+    loop = Bool(True)
+    num_frames = Int(0)
+    position = Int(0)  # index of the next frame to be played
+
+    view = View(
+        Item('path'),
+        Item('playback'),
+        HGroup(
+            Item('frame_rate', enabled_when="playback == 'real time'"),
+            Label('fps')),
+        Item('loop'),
+        Item('num_frames', style='readonly', label='Number of frames'))
+
+    def __init__(self, **traits):
+        super(ReplayCamera, self).__init__(resolution=(320, 240),
+            id_string='Replay (no file loaded)',
+            **traits)
+        self._frames = None
+        self._is_open = False
+
+    def open(self):
+        self._is_open = True
+        self._frame_deadline = None
+        if not self.path:
+            return
+        try:
+            self._frames, frame_rate = _load_frames(self.path)
+        except (IOError, ValueError, KeyError) as e:
+            raise CameraError('Could not load {}: {}'.format(self.path, e),
+                self.camera_number)
+        self.num_frames = len(self._frames)
+        self.position = 0
+        height, width = self._frames[0].shape[:2]
+        self.resolution = (width, height)
+        self.id_string = 'Replay of ' + os.path.basename(self.path)
+        if frame_rate is not None:
+            self.frame_rate = int(min(max(round(frame_rate), 1), 500))
+
+    def close(self):
+        self._is_open = False
+        self._frames = None
+
+    def query_frame(self):
+        if self._frames is None:
+            width, height = self.resolution
+            frame = self._get_buffer((height, width), N.uint8)
+            frame.fill(0)
+        else:
+            if self.position >= self.num_frames:
+                self.position = 0 if self.loop else self.num_frames - 1
+            page = self._frames[self.position]
+            self.position += 1
+            # Copying into the buffer is what reads the page from disk
+            frame = self._get_buffer(page.shape, page.dtype.newbyteorder('='))
+            frame[...] = page
+        self.frame = frame
+
+        if self.playback == 'real time':
+            self._wait_for_next_frame()
+
+    def find_resolutions(self):
+        return [self.resolution]
+
+    def _path_changed(self):
+        if self._is_open:
+            self.open()
+
+
+def _load_frames(path):
+    """
+    Returns a sequence of memory-mapped frames from the file @path, and the
+    frame rate it was recorded at if the file says so.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.npy':
+        frames = N.load(path, mmap_mode='r')
+        if frames.ndim == 2 or (frames.ndim == 3 and frames.shape[-1] in (3, 4)):
+            frames = frames[N.newaxis, ...]  # single frame
+        return frames, None
+    if ext in ('.tif', '.tiff'):
+        return _tiff_pages(path), None
+    return _raw_frames(path)
+
+
+def _raw_frames(path):
+    header_path = os.path.splitext(path)[0] + '.json'
+    with open(header_path) as f:
+        header = json.load(f)
+    dtype = N.dtype(str(header.get('dtype', 'uint16')))
+    shape = (header['height'], header['width'])
+    channels = header.get('channels', 1)
+    if channels > 1:
+        shape += (channels,)
+    offset = header.get('header_bytes', 0)
+    frame_bytes = int(N.prod(shape)) * dtype.itemsize
+    count = (os.path.getsize(path) - offset) // frame_bytes
+    if count < 1:
+        raise ValueError('file contains no complete frames')
+    frames = N.memmap(path, dtype=dtype, mode='r', offset=offset,
+        shape=(count,) + shape)
+    return frames, header.get('frame_rate')
+
+
+# TIFF tags that we need
+_WIDTH, _HEIGHT, _BITS, _COMPRESSION = 256, 257, 258, 259
+_STRIP_OFFSETS, _SAMPLES, _STRIP_BYTES = 273, 277, 279
+_PLANAR, _SAMPLE_FORMAT = 284, 339
+_TYPE_SIZES = {1: 1, 3: 2, 4: 4, 16: 8}  # BYTE, SHORT, LONG, LONG8
+_TYPE_CODES = {1: 'u1', 3: 'u2', 4: 'u4', 16: 'u8'}
+
+
+def _tiff_pages(path):
+    """
+    Maps the pages of an uncompressed TIFF file whose image data is stored
+    contiguously, which is how most cameras and image libraries write them.
+    """
+    with open(path, 'rb') as f:
+        order = {b'II': '<', b'MM': '>'}.get(f.read(2))
+    if order is None:
+        raise ValueError('not a TIFF file')
+    data = N.memmap(path, dtype=N.uint8, mode='r')
+
+    def read(offset, code, count=1):
+        dt = N.dtype(order + code)
+        return N.frombuffer(data, dtype=dt, count=count, offset=offset)
+
+    if read(2, 'u2')[0] != 42:
+        raise ValueError('BigTIFF files are not supported')
+    pages = []
+    ifd = int(read(4, 'u4')[0])
+    while ifd:
+        num_entries = int(read(ifd, 'u2')[0])
+        tags = {}
+        for ix in range(num_entries):
+            entry = ifd + 2 + 12 * ix
+            tag, kind = read(entry, 'u2', 2)
+            count = int(read(entry + 4, 'u4')[0])
+            if kind not in _TYPE_SIZES:
+                continue
+            value_offset = entry + 8
+            if _TYPE_SIZES[kind] * count > 4:
+                value_offset = int(read(entry + 8, 'u4')[0])
+            tags[int(tag)] = read(value_offset, _TYPE_CODES[kind], count)
+        pages.append(_tiff_page(data, tags, order))
+        ifd = int(read(ifd + 2 + 12 * num_entries, 'u4')[0])
+    if not pages:
+        raise ValueError('TIFF file contains no images')
+    return pages
+
+
+def _tiff_page(data, tags, order):
+    if tags.get(_COMPRESSION, [1])[0] != 1:
+        raise ValueError('compressed TIFF files are not supported')
+    samples = int(tags.get(_SAMPLES, [1])[0])
+    if samples > 1 and tags.get(_PLANAR, [1])[0] != 1:
+        raise ValueError('planar TIFF files are not supported')
+    bits = int(tags.get(_BITS, [1])[0])
+    kind = {1: 'u', 2: 'i', 3: 'f'}[int(tags.get(_SAMPLE_FORMAT, [1])[0])]
+    dtype = N.dtype('{}{}{}'.format(order, kind, bits // 8))
+    shape = (int(tags[_HEIGHT][0]), int(tags[_WIDTH][0]))
+    if samples > 1:
+        shape += (samples,)
+
+    offsets = tags[_STRIP_OFFSETS]
+    byte_counts = tags[_STRIP_BYTES]
+    if N.any(offsets[1:] != offsets[:-1] + byte_counts[:-1]):
+        raise ValueError('TIFF image data is not contiguous')
+    return N.ndarray(shape, dtype=dtype, buffer=data, offset=int(offsets[0]))
@@ -21,5 +21,6 @@ class Rotator(TransformPlugin):
             label='Rotation',
             show_border=True))
 
-    def _process(self, frame):
+    def _process(self, frame, out):
+        # A view of the frame; the next stage reads it without a copy
         return N.rot90(frame, self.rotation_angle)
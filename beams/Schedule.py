@@ -0,0 +1,72 @@
+from Frame import clock
+
+
+class Schedule(object):
+    """
+    Decides which frames something is done for: at most @rate times per
+    second, or on every @every'th frame, or both. The times are deadlines on
+    a fixed grid, so the time spent processing does not lower the rate; but
+    if we fall behind, the missed deadlines are skipped rather than made up
+    for in a burst.
+    """
+
+    def __init__(self, rate=None, every=1):
+        self.rate = rate
+        self.every = max(1, every)
+        self._deadline = None
+        self._count = 0
+
+    def due(self, now=None):
+        """Returns whether it is time to act; call once per frame."""
+        self._count += 1
+        if (self._count - 1) % self.every != 0:
+            return False
+        if not self.rate:
+            return True
+
+        now = clock() if now is None else now
+        period = 1.0 / self.rate
+        if self._deadline is None:
+            self._deadline = now
+        if now < self._deadline:
+            self._count -= 1  # try again with the next frame
+            return False
+        self._deadline += period
+        if self._deadline <= now:
+            self._deadline = now + period
+        return True
+
+    def reset(self):
+        self._deadline = None
+        self._count = 0
+
+
+class RateMeter(object):
+    """Measures how often tick() is called, averaged over about @window s"""
+
+    def __init__(self, window=1.0):
+        self.window = window
+        self._last = None
+        self._interval = None
+
+    def tick(self, now=None):
+        now = clock() if now is None else now
+        if self._last is not None:
+            interval = now - self._last
+            if self._interval is None:
+                self._interval = interval
+            else:
+                # Exponential moving average, weighted by the interval so
+                # that the window is in seconds rather than in ticks
+                weight = min(1.0, interval / self.window)
+                self._interval += weight * (interval - self._interval)
+        self._last = now
+
+    @property
+    def rate(self):
+        """Ticks per second, or 0 if not known or not ticking anymore"""
+        if not self._interval or self._last is None:
+            return 0.0
+        if clock() - self._last > max(self.window, 2 * self._interval):
+            return 0.0
+        return 1.0 / self._interval
@@ -0,0 +1,168 @@
+"""
+Power spectral density of a series of measurements with real timestamps,
+estimated while the measurements come in.
+"""
+
+import numpy as N
+
+RING_SIZE = 1 << 14  # samples kept; must be more than a segment
+MIN_SAMPLES = 16  # to estimate the sample rate from
+MAX_GAP = 5  # longest gap, in sample intervals, to interpolate over
+RATE_TOLERANCE = 0.1  # relative change in sample rate that starts over
+
+
+class WelchSpectrum(object):
+    """
+    Welch estimate of the power spectral density of several quantities,
+    averaged over the last @num_averages segments of @segment_length
+    samples, which overlap by half.
+
+    The samples are kept in a ring buffer with their timestamps. Each
+    segment is resampled from those on an even grid at the sample rate, so
+    that the frequencies stay right when samples are missing; a segment
+    with a gap of more than MAX_GAP sample intervals is skipped. The grid
+    starts at a sample and follows the measured rate, so that with a steady
+    frame rate the grid points fall on the samples and the interpolation
+    doesn't smooth them.
+    Each segment is transformed once, when the samples for it are in, and
+    the periodograms of the last segments are kept for the average.
+    """
+
+    def __init__(self, channels, segment_length=256, num_averages=8):
+        self.channels = channels
+        self.segment_length = segment_length
+        self.num_averages = num_averages
+        self._times = N.zeros(RING_SIZE)
+        self._values = N.zeros((RING_SIZE, channels))
+        # Hann window, and the factor that makes a periodogram a one-sided
+        # density without the sample rate
+        length = segment_length
+        self._window = 0.5 - 0.5 * N.cos(2 * N.pi * N.arange(length) / length)
+        self._scale = 2.0 * N.ones(length // 2 + 1) / (self._window ** 2).sum()
+        self._scale[0] /= 2
+        if length % 2 == 0:
+            self._scale[-1] /= 2
+        # For removing a straight line from each segment
+        self._ramp = N.arange(length) - (length - 1) / 2.0
+        self._ramp /= N.sqrt((self._ramp ** 2).sum())
+        self.reset()
+
+    def reset(self):
+        self.count = 0  # samples added
+        self.rate = None  # samples per second
+        self.skipped = 0  # segments that had a gap
+        self._next_start = None  # time at which the next segment starts
+        self._periodograms = N.zeros((self.num_averages,
+            self.segment_length // 2 + 1, self.channels))
+        self._num_segments = 0  # periodograms calculated since the reset
+
+    @property
+    def num_segments(self):
+        """Number of segments in the average"""
+        return min(self._num_segments, self.num_averages)
+
+    @property
+    def frequencies(self):
+        if self.rate is None:
+            return N.zeros(0)
+        return (N.arange(self.segment_length // 2 + 1) * self.rate
+            / self.segment_length)
+
+    @property
+    def psd(self):
+        """
+        Power spectral density, one row per frequency and one column per
+        quantity, in units squared per Hz; None until a segment is in
+        """
+        if not self.num_segments:
+            return None
+        return self._periodograms[:self.num_segments].mean(axis=0) / self.rate
+
+    def add(self, timestamp, values):
+        """
+        Adds the @values of the quantities at @timestamp, which must be
+        later than the previous one. Returns whether a new segment was
+        added to the average.
+        """
+        index = self.count % RING_SIZE
+        self._times[index] = timestamp
+        self._values[index] = values
+        self.count += 1
+
+        if self.rate is None:
+            if self.count < MIN_SAMPLES:
+                return False
+            times, _ = self._recent(min(self.count, RING_SIZE))
+            self.rate = 1.0 / _sample_interval(N.diff(times))
+            self._next_start = times[0]
+
+        added = False
+        while (self._next_start + self.segment_length / self.rate
+                <= timestamp):
+            added = self._add_segment() or added
+            if self.rate is None:
+                return added  # the sample rate changed
+        return added
+
+    def _recent(self, number):
+        """Returns the times and values of the last @number samples"""
+        indices = N.arange(self.count - number, self.count) % RING_SIZE
+        return self._times[indices], self._values[indices]
+
+    def _add_segment(self):
+        period = 1.0 / self.rate
+        times, values = self._recent(min(self.count, RING_SIZE))
+        if times[0] > self._next_start:
+            # Fell behind so far that the samples are gone; start again
+            # from the oldest one
+            self._next_start = times[0]
+            return False
+
+        # Start at the sample nearest to where the segment is due
+        first = N.searchsorted(times, self._next_start)
+        if (first > 0 and self._next_start - times[first - 1]
+                < times[first] - self._next_start):
+            first -= 1
+        start = times[first]
+        end = start + (self.segment_length - 1) * period
+        self._next_start = start + self.segment_length // 2 * period
+
+        # The samples that the segment is interpolated from
+        last = N.searchsorted(times, end, side='left') + 1
+        times, values = times[first:last], values[first:last]
+        intervals = N.diff(times)
+        interval = _sample_interval(intervals)
+        if abs(interval * self.rate - 1) > RATE_TOLERANCE:
+            # The camera's frame rate changed, so the old segments don't
+            # belong in the same average
+            self.reset()
+            return False
+        if intervals.max() > MAX_GAP * period:
+            self.skipped += 1
+            return False
+        # Follow small changes in the rate, so that the grid doesn't drift
+        # away from the samples
+        self.rate = 1.0 / interval
+
+        grid = start + N.arange(self.segment_length) * interval
+        segment = N.column_stack([N.interp(grid, times, values[:, channel])
+            for channel in range(self.channels)])
+        segment -= segment.mean(axis=0)
+        segment -= N.outer(self._ramp, self._ramp.dot(segment))
+        segment *= self._window[:, N.newaxis]
+        spectrum = N.fft.rfft(segment, axis=0)
+        periodogram = spectrum.real ** 2 + spectrum.imag ** 2
+        periodogram *= self._scale[:, N.newaxis]
+        self._periodograms[self._num_segments % self.num_averages] = (
+            periodogram)
+        self._num_segments += 1
+        return True
+
+
+def _sample_interval(intervals):
+    """
+    Returns the time between samples, from the @intervals between the ones
+    that were received. An interval with missing samples counts as several.
+    """
+    steps = N.maximum(N.round(intervals / N.median(intervals)), 1)
+    return intervals.sum() / steps.sum()
@@ -0,0 +1,140 @@
+"""
+Statistics of long series of measurements, updated one sample at a time in
+constant memory, so that they can run for hours at the camera's frame rate.
+Each sample is an array of several quantities, which are treated separately.
+"""
+
+import numpy as N
+
+
+class RunningStatistics(object):
+    """
+    Mean, variance, minimum and maximum of the samples so far, using
+    Welford's algorithm, which doesn't lose precision on long series the way
+    summing the squares does.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = N.zeros(self.size)
+        self._m2 = N.zeros(self.size)  # sum of squared deviations
+        self.minimum = N.empty(self.size)
+        self.minimum.fill(N.inf)
+        self.maximum = N.empty(self.size)
+        self.maximum.fill(-N.inf)
+
+    def add(self, sample):
+        self.count += 1
+        delta = sample - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (sample - self.mean)
+        N.minimum(self.minimum, sample, out=self.minimum)
+        N.maximum(self.maximum, sample, out=self.maximum)
+
+    @property
+    def variance(self):
+        """Sample variance, or NaN with fewer than two samples"""
+        if self.count < 2:
+            return N.repeat(N.nan, self.size)
+        return self._m2 / (self.count - 1)
+
+    @property
+    def std(self):
+        return N.sqrt(self.variance)
+
+
+class AllanDeviation(object):
+    """
+    Overlapping Allan deviation of the samples so far, at averaging times of
+    1, 2, 4, 8, ... samples.
+
+    The averages over m samples are differences of the phase, the running
+    sum of the samples, m samples apart. The phase is kept at several
+    levels of decimation: level 0 has every sample, level 1 every second
+    one, and so on. Each level only keeps the last 2 @lags + 1 phases, which
+    is enough for the Allan variance at up to @lags of its own samples. Level
+    0 gives the averaging times 1, 2, 4, ..., @lags samples, with all
+    possible overlapping averages; each higher level adds the next octave,
+    with averages that start every 2^level samples, i.e. still overlapping
+    @lags times.
+    """
+
+    def __init__(self, size, lags=8, levels=20):
+        if lags & (lags - 1):
+            raise ValueError('lags must be a power of 2')
+        self.size = size
+        self.lags = lags
+        self.levels = levels
+        # Averaging time in samples, and the level and lag it comes from
+        self.taus = []
+        self._lags = []
+        lag = 1
+        while lag <= lags:
+            self.taus.append(lag)
+            self._lags.append((0, lag))
+            lag *= 2
+        for level in range(1, levels):
+            self.taus.append(lags << level)
+            self._lags.append((level, lags))
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self._offset = None
+        self._phase = N.zeros(self.size)
+        length = 2 * self.lags + 1
+        self._rings = N.zeros((self.levels, length, self.size))
+        self._ring_counts = N.zeros(self.levels, dtype=int)
+        self._sums = N.zeros((len(self.taus), self.size))
+        self._counts = N.zeros(len(self.taus), dtype=int)
+
+    def add(self, sample):
+        if self._offset is None:
+            # Accumulate differences from the first sample, so that the
+            # phase stays small and keeps its precision
+            self._offset = N.array(sample, dtype=float)
+            # The phase starts at 0 before the first sample, and the first
+            # average is the difference from there
+            self._add_phase(0, self._phase)
+        self._phase += sample - self._offset
+        self.count += 1
+        self._add_phase(0, self._phase)
+
+    def _add_phase(self, level, phase):
+        while level < self.levels:
+            ring = self._rings[level]
+            length = len(ring)
+            count = self._ring_counts[level]
+            ring[count % length] = phase
+            count += 1
+            self._ring_counts[level] = count
+            for index, (tau_level, lag) in enumerate(self._lags):
+                if tau_level != level or count <= 2 * lag:
+                    continue
+                # Second difference of the phase: the difference between
+                # two consecutive averages over @lag samples, times @lag
+                newest = (count - 1) % length
+                difference = (phase - 2 * ring[(newest - lag) % length]
+                    + ring[(newest - 2 * lag) % length])
+                self._sums[index] += difference * difference
+                self._counts[index] += 1
+            # The next level gets every other phase of this one
+            if count % 2 == 0:
+                return
+            level += 1
+
+    def deviations(self):
+        """
+        Returns the averaging times in samples and an array with, for each
+        of them, the Allan deviation of each quantity; NaN where there
+        aren't enough samples yet
+        """
+        taus = N.array(self.taus, dtype=float)
+        counts = N.maximum(self._counts, 1)[:, N.newaxis]
+        variances = self._sums / (2 * taus[:, N.newaxis] ** 2 * counts)
+        variances[self._counts == 0] = N.nan
+        return taus, N.sqrt(variances)
@@ -0,0 +1,154 @@
+"""
+Latency measurements of the stages of the frame pipeline. Each stage has a
+LatencyHistogram in a global registry, which is looked up by name:
+
+    start = clock()
+    ...
+    get_histogram('query_frame').add(clock() - start)
+
+or, where the overhead of a context manager doesn't matter:
+
+    with timed('query_frame'):
+        ...
+
+report() summarizes all of them, e.g. for the heads-up display.
+"""
+
+import math
+import threading
+
+from Frame import clock
+
+# Bins are spaced logarithmically from 1 us to 100 s
+MIN_LATENCY = 1e-6
+BINS_PER_DECADE = 20
+NUM_BINS = 8 * BINS_PER_DECADE + 1
+
+
+class LatencyHistogram(object):
+    """
+    Counts how often each latency occurs, in logarithmically spaced bins,
+    so that percentiles can be estimated in constant memory. Only the last
+    one to two times @window seconds are counted.
+    """
+
+    def __init__(self, name, window=10.0):
+        self.name = name
+        self.window = window
+        self._lock = threading.Lock()
+        self._current = [0] * NUM_BINS
+        self._previous = [0] * NUM_BINS
+        self._started = clock()
+
+    def add(self, seconds):
+        """Counts a measurement of @seconds."""
+        if seconds <= MIN_LATENCY:
+            index = 0
+        else:
+            index = min(NUM_BINS - 1, int(
+                math.log10(seconds / MIN_LATENCY) * BINS_PER_DECADE) + 1)
+        with self._lock:
+            now = clock()
+            if now - self._started > self.window:
+                self._previous = self._current
+                self._current = [0] * NUM_BINS
+                self._started = now
+            self._current[index] += 1
+
+    def counts(self):
+        """Number of measurements in each bin, in the rolling window"""
+        with self._lock:
+            return [a + b for a, b in zip(self._current, self._previous)]
+
+    def percentile(self, q, counts=None):
+        """
+        Returns the latency in seconds that @q percent of the measurements
+        were below, or None if there are none.
+        """
+        if counts is None:
+            counts = self.counts()
+        total = sum(counts)
+        if total == 0:
+            return None
+        rank = total * q / 100.0
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank and count:
+                return _bin_center(index)
+        return _bin_center(NUM_BINS - 1)
+
+    def summary(self):
+        """Returns a dict with the count and the 50, 95 and 99 percentiles"""
+        counts = self.counts()
+        return {
+            'count': sum(counts),
+            'p50': self.percentile(50, counts),
+            'p95': self.percentile(95, counts),
+            'p99': self.percentile(99, counts),
+        }
+
+    def reset(self):
+        with self._lock:
+            self._current = [0] * NUM_BINS
+            self._previous = [0] * NUM_BINS
+            self._started = clock()
+
+
+def _bin_center(index):
+    if index == 0:
+        return MIN_LATENCY
+    # Geometric middle of the bin
+    return MIN_LATENCY * 10 ** ((index - 0.5) / BINS_PER_DECADE)
+
+
+_histograms = {}
+_registry_lock = threading.Lock()
+
+
+def get_histogram(name):
+    """Returns the histogram called @name, creating it if necessary."""
+    try:
+        return _histograms[name]
+    except KeyError:
+        with _registry_lock:
+            return _histograms.setdefault(name, LatencyHistogram(name))
+
+
+def histograms():
+    """Returns a dict of all histograms by name."""
+    with _registry_lock:
+        return dict(_histograms)
+
+
+def reset():
+    for histogram in histograms().values():
+        histogram.reset()
+
+
+class timed(object):
+    """Context manager that adds the time spent in it to a histogram"""
+
+    def __init__(self, name):
+        self.histogram = get_histogram(name)
+
+    def __enter__(self):
+        self._start = clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.add(clock() - self._start)
+
+
+def report():
+    """Returns a text with the percentiles of each pipeline stage in ms."""
+    lines = []
+    for name, histogram in sorted(histograms().items()):
+        summary = histogram.summary()
+        if not summary['count']:
+            continue
+        lines.append('{}: {:.2f} / {:.2f} / {:.2f} ms'.format(name,
+            *[summary[key] * 1000.0 for key in ('p50', 'p95', 'p99')]))
+    if not lines:
+        return 'No timing data'
+    return 'Latency (50% / 95% / 99%)\n' + '\n'.join(lines)
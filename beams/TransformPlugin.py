@@ -1,14 +1,59 @@
-from traits.api import HasTraits, Bool
+import numpy as N
+from traits.api import HasTraits, Bool, Instance
+from Frame import Frame, clock
+from Timing import get_histogram
 
 
 class TransformPlugin(HasTraits):
 
     active = Bool(False)
 
-    def process_frame(self, frame):
+    # The frame that is being transformed, for its camera settings
+    current_frame = Instance(Frame)
+
+    # Whether _process() can write its result over its input array
+    in_place = False
+
+    def __init__(self, **traits):
+        super(TransformPlugin, self).__init__(**traits)
+        self._outputs = {}
+
+    def process_frame(self, frame, overwrite=False):
+        """
+        Transforms a Frame, returning a new Frame with the same metadata. If
+        @overwrite is True, the frame's array may be used for the result.
+        The result is only valid until the next frame is transformed.
+        """
         if not self.active:
             return frame
-        return self._process(frame)
+        self.current_frame = frame
+        out = frame.data if overwrite and self.in_place else None
+        start = clock()
+        data = self._process(frame.data, out)
+        get_histogram('transform ' + type(self).__name__).add(clock() - start)
+        return frame.derive(data)
+
+    def _process(self, frame, out):
+        """
+        Transforms the array @frame. If @out is not None, it is @frame
+        itself, and the result should be written there. Otherwise, write the
+        result into a buffer from _get_output(), or return a view of @frame.
+        """
+        return frame
+
+    def _get_output(self, shape, dtype):
+        """
+        Returns a buffer for the result, which is reused for every frame of
+        the same shape and data type.
+        """
+        key = (tuple(shape), N.dtype(dtype))
+        try:
+            return self._outputs[key]
+        except KeyError:
+            # Resolution changed; don't keep the buffers for the old one
+            self._outputs.clear()
+            buffer = self._outputs[key] = N.empty(shape, dtype=dtype)
+            return buffer
 
     def _active_changed(self, value):
         if value:
@@ -21,3 +66,16 @@ class TransformPlugin(HasTraits):
 
     def deactivate(self):
         pass
+
+
+def apply_transforms(plugins, frame):
+    """
+    Runs @frame through each of the active @plugins in turn. The camera's
+    buffer is never written to, but once a plugin has written its result
+    into a buffer of its own, the next plugins may work in that buffer.
+    """
+    camera_data = frame.data
+    for plugin in plugins:
+        overwrite = not N.may_share_memory(frame.data, camera_data)
+        frame = plugin.process_frame(frame, overwrite)
+    return frame
@@ -0,0 +1,138 @@
+#coding: utf8
+import numpy as N
+from traits.api import (Range, Enum, Button, Int, Instance,
+    on_trait_change)
+from traitsui.api import View, VGroup, Item
+from chaco.api import ArrayPlotData, Plot
+from enable.api import ComponentEditor
+from DisplayPlugin import (DisplayPlugin, SCHEDULE_GROUP, SCHEDULES,
+    EVERY_FRAME)
+from Moments import centroid_from_projections
+from Percentile import percentile
+from Spectrum import WelchSpectrum
+
+SEGMENT_LENGTHS = (64, 128, 256, 512, 1024, 2048)
+
+
+class VibrationSpectrum(DisplayPlugin):
+    """
+    Power spectral density of the jitter of the beam centroid, to find
+    mechanical vibrations. The spectrum is a Welch average over the last
+    few segments of frames, using the frames' capture times, so it stays
+    right when frames are dropped. The highest frequency is half the frame
+    rate, and the resolution is the frame rate divided by the segment
+    length.
+    """
+
+    background_percentile = Range(0.0, 100.0, 15.0)
+    segment_length = Enum(256, SEGMENT_LENGTHS)
+    num_averages = Range(1, 64, 8)
+    reset = Button()
+
+    # The spectrum needs every frame, and the centroid is cheap
+    schedule = Enum(EVERY_FRAME, SCHEDULES)
+
+    plot_data = Instance(ArrayPlotData)
+    plot = Instance(Plot)
+
+    _updates = Int()  # spectra calculated, to trigger redrawing
+
+    view = View(
+        VGroup(
+            Item('active'),
+            Item('background_percentile'),
+            Item('segment_length'),
+            Item('num_averages', label='Average # segments'),
+            Item('reset', show_label=False),
+            SCHEDULE_GROUP,
+            Item('plot', show_label=False, editor=ComponentEditor(),
+                width=320, height=240),
+            label='Vibration Spectrum',
+            show_border=True))
+
+    def __init__(self, **traits):
+        self._spectrum = None  # created in the processing thread
+        self._latest = None  # frequencies, spectrum, segments, skipped
+        super(VibrationSpectrum, self).__init__(**traits)
+        if self.screen is None:
+            return  # nothing to draw on
+        self.on_trait_change(self._update_plot, '_updates',
+            dispatch='ui')
+
+    def _plot_data_default(self):
+        return ArrayPlotData(frequency=N.array([]), psd_x=N.array([]),
+            psd_y=N.array([]))
+
+    def _plot_default(self):
+        plot = Plot(self.plot_data, value_scale='log')
+        plot.plot(('frequency', 'psd_x'), type='line', color='blue',
+            name='x')
+        plot.plot(('frequency', 'psd_y'), type='line', color='red',
+            name='y')
+        plot.index_axis.title = 'Frequency (Hz)'
+        plot.value_axis.title = u'PSD (px²/Hz)'
+        plot.legend.visible = True
+        return plot
+
+    @on_trait_change('segment_length, num_averages, reset')
+    def _start_over(self):
+        # Start over in the processing thread, not halfway through a frame
+        self._spectrum = None
+
+    def _process(self, context):
+        spectrum = self._spectrum
+        if spectrum is None:
+            spectrum = self._spectrum = WelchSpectrum(2,
+                self.segment_length, self.num_averages)
+
+        if context.is_monochrome:
+            frame = context.data
+        else:
+            frame = context.gray
+        background = percentile(frame, self.background_percentile,
+            context.histogram)
+        centroid = centroid_from_projections(context.column_projection,
+            context.row_projection, background)
+
+        if spectrum.add(context.frame.timestamp, centroid):
+            # Skip the constant term, which the detrending removed
+            self._latest = (spectrum.frequencies[1:], spectrum.psd[1:],
+                spectrum.num_segments, spectrum.skipped)
+            self._updates += 1
+
+    def results(self):
+        if self._latest is None:
+            # The same results as later, so that they fit the same columns
+            result = dict.fromkeys(['sample_rate', 'peak_frequency_x',
+                'peak_psd_x', 'rms_x', 'peak_frequency_y', 'peak_psd_y',
+                'rms_y'], float('nan'))
+            result.update(segments=0, skipped=0)
+            return result
+        frequencies, psd, segments, skipped = self._latest
+        resolution = frequencies[0]
+        result = {'sample_rate': float(2 * frequencies[-1]),
+            'segments': segments, 'skipped': skipped}
+        for column, axis in enumerate('xy'):
+            peak = N.argmax(psd[:, column])
+            result['peak_frequency_' + axis] = float(frequencies[peak])
+            result['peak_psd_' + axis] = float(psd[peak, column])
+            result['rms_' + axis] = float(N.sqrt(psd[:, column].sum()
+                * resolution))
+        return result
+
+    def _update_plot(self):
+        if self._latest is None:
+            return
+        frequencies, psd = self._latest[:2]
+        self.plot_data.set_data('frequency', frequencies)
+        self.plot_data.set_data('psd_x', psd[:, 0])
+        self.plot_data.set_data('psd_y', psd[:, 1])
+        result = self.results()
+        self.screen.hud('vibration',
+            'Vibration peak: {:.1f} Hz, {:.1f} Hz\n'
+            'Vibration RMS: {:.3f}, {:.3f}'.format(
+                result['peak_frequency_x'], result['peak_frequency_y'],
+                result['rms_x'], result['rms_y']))
+
+    def deactivate(self):
+        self.screen.hud('vibration', None)
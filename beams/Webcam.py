@@ -1,3 +1,4 @@
+import numpy as N
 import cv2
 from cv2.cv import CV_CAP_PROP_FRAME_WIDTH as FRAME_WIDTH
 from cv2.cv import CV_CAP_PROP_FRAME_HEIGHT as FRAME_HEIGHT
@@ -41,9 +42,17 @@ class Webcam(Camera):
         self._capture.release()
 
     def query_frame(self):
-        success, frame = self._capture.read()
+        width, height = self.resolution
+        buffer = self._get_buffer((height, width, 3), N.uint8)
+        success, frame = self._capture.read(buffer)
         if not success:
+            self._release_buffer(buffer)
             raise CameraError('Could not query image', self.camera_number)
+        if N.may_share_memory(frame, buffer):
+            frame = buffer  # filled in place
+        else:
+            # OpenCV allocated a new image, e.g. because the size changed
+            self._release_buffer(buffer)
         self.frame = frame
 
     def _camera_number_changed(self, old, new):
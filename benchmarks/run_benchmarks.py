@@ -0,0 +1,227 @@
+"""
+Microbenchmarks for the analysis kernels and the camera generators.
+
+Each kernel is timed on synthetic beam images of several sizes and data
+types, and the best time per call is reported. Results can be saved and
+compared with an earlier run:
+
+    python benchmarks/run_benchmarks.py --save before.json
+    ... change something ...
+    python benchmarks/run_benchmarks.py --compare before.json
+
+Use --sizes, --dtypes and --only to run a subset, e.g.
+
+    python benchmarks/run_benchmarks.py --sizes 640x480 --only moments
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import timeit
+
+os.environ.setdefault('ETS_TOOLKIT', 'null')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'beams'))
+
+import numpy as N
+from chaco.api import DataRange1D
+
+from AwesomeColorMaps import isoluminant
+from BackgroundSubtract import BackgroundSubtract
+from BeamProfiler import BeamProfiler, _calculate_moments, _crop
+from Centroid import _calculate_centroid
+from DeltaDetector import DeltaDetector
+from DummyGaussian import DummyGaussian
+from Frame import Frame
+from FrameContext import FrameContext
+from MultiSpot import MultiSpot
+
+SIZES = ['320x240', '640x480', '1280x1024', '2048x2048', '4096x4096']
+DTYPES = ['uint8', 'uint16', 'rgb']
+MIN_TIME = 0.2  # seconds to run each measurement for, at least
+
+
+def make_frame(size, dtype, seed=0):
+    """A noisy elliptical Gaussian beam, off center, as a camera gives it"""
+    width, height = size
+    random = N.random.RandomState(seed)
+    y, x = N.ogrid[:height, :width]
+    sigma = min(width, height) / 10.0
+    beam = N.exp(-((x - 0.6 * width) ** 2 / (2 * sigma ** 2)
+        + (y - 0.4 * height) ** 2 / (2 * (0.6 * sigma) ** 2)))
+    maximum = 65535 if dtype == 'uint16' else 255
+    frame = 0.8 * maximum * beam + random.uniform(0, 0.05 * maximum,
+        (height, width))
+    if dtype == 'rgb':
+        frame = N.dstack((frame, 0.9 * frame, 0.5 * frame))
+    return frame.astype(N.uint16 if dtype == 'uint16' else N.uint8)
+
+
+def kernels(frame):
+    """
+    Returns (name, function) for each benchmark on @frame. Setup that is not
+    part of what is measured is done here.
+    """
+    gray = FrameContext(Frame(frame)).gray
+    profile = gray - N.percentile(gray, 15.0)
+    moments = _calculate_moments(profile)
+
+    def process(plugin):
+        return lambda: plugin._process(FrameContext(Frame(frame)))
+
+    profilers = [BeamProfiler(screen=None, num_crops=crops)
+        for crops in range(6)]
+    tracker = BeamProfiler(screen=None, tracking=True)
+    tracker._process(FrameContext(Frame(frame)))  # finds the beam
+    fitter = BeamProfiler(screen=None, gaussian_fit=True)
+    fitter._process(FrameContext(Frame(frame)))  # the first fit
+    delta = DeltaDetector(screen=None)
+    delta._process(FrameContext(Frame(frame)))
+    _check_delta(delta, frame)
+    background = BackgroundSubtract(active=True, num_frames=1,
+        use_library=False)
+    background.process_frame(Frame(frame))  # captures the background
+
+    result = [
+        ('BeamProfiler._calculate_moments',
+            lambda: _calculate_moments(profile)),
+        ('BeamProfiler._crop', lambda: _crop(profile, 1.5, *moments)),
+    ]
+    result += [('BeamProfiler._process, {} crops'.format(crops),
+        process(profilers[crops])) for crops in range(6)]
+    result += [
+        ('BeamProfiler._process, tracking', process(tracker)),
+        ('BeamProfiler._process, Gaussian fit', process(fitter)),
+        ('Centroid._calculate_centroid', lambda: _calculate_centroid(gray)),
+        ('BackgroundSubtract._process',
+            lambda: background.process_frame(Frame(frame))),
+        ('DeltaDetector._process', process(delta)),
+        ('MultiSpot._process', process(MultiSpot(screen=None))),
+    ]
+    return result
+
+
+def _check_delta(delta, frame):
+    """
+    Checks that @delta measures a pixel of @frame getting darker, which
+    must not wrap around with unsigned pixels; then leaves it on @frame
+    """
+    changed = frame.copy()
+    changed.flat[0] = 3
+    delta._process(FrameContext(Frame(changed)))
+    changed.flat[0] = 1
+    delta._process(FrameContext(Frame(changed)))
+    results = delta.results()
+    assert results['maximum_delta'] == 2.0, results
+    assert abs(results['average_delta'] * frame.size + 2) < 1e-6, results
+    delta._process(FrameContext(Frame(frame)))
+
+
+def dummy_gaussian(size):
+    camera = DummyGaussian(noise_amplitude=20)
+    camera.resolution = size
+    camera._wait_for_next_frame = lambda: None  # don't simulate frame rate
+    camera.open()
+    return camera.query_frame
+
+
+def measure(function, repeat):
+    """Returns the best time per call in seconds."""
+    timer = timeit.Timer(function)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= MIN_TIME or number >= 1 << 20:
+            break
+        number *= 2 if elapsed <= 0 else max(2, int(MIN_TIME / elapsed))
+    best = min([elapsed] + timer.repeat(repeat - 1, number))
+    return best / number
+
+
+def run(sizes, dtypes, only, repeat):
+    results = {}
+
+    def record(name, size, dtype, function):
+        if only and not any(word.lower() in name.lower() for word in only):
+            return
+        key = '{} | {} | {}'.format(name, size, dtype)
+        seconds = measure(function, repeat)
+        results[key] = seconds
+        print('{:<60} {:>12}'.format(key, _format_time(seconds)))
+        sys.stdout.flush()
+
+    record('AwesomeColorMaps.isoluminant', '-', '-',
+        lambda: isoluminant(DataRange1D(low=0.0, high=255.0)))
+    for size_name in sizes:
+        size = tuple(int(n) for n in size_name.split('x'))
+        if 'uint16' in dtypes:
+            record('DummyGaussian.query_frame', size_name, 'uint16',
+                dummy_gaussian(size))
+        for dtype in dtypes:
+            frame = make_frame(size, dtype)
+            for name, function in kernels(frame):
+                record(name, size_name, dtype, function)
+    return results
+
+
+def compare(results, baseline):
+    print('\n{:<60} {:>12} {:>12} {:>8}'.format('Compared with baseline',
+        'before', 'after', 'speedup'))
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        before, after = baseline[key], results[key]
+        print('{:<60} {:>12} {:>12} {:>7.2f}x'.format(key,
+            _format_time(before), _format_time(after), before / after))
+
+
+def _format_time(seconds):
+    for unit, factor in (('s', 1.0), ('ms', 1e3), ('us', 1e6)):
+        if seconds * factor >= 1.0:
+            return '{:.3f} {}'.format(seconds * factor, unit)
+    return '{:.3f} ns'.format(seconds * 1e9)
+
+
+def _split(names):
+    return [name for name in names.split(',') if name]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the Beams benchmarks.')
+    parser.add_argument('--sizes', type=_split, default=SIZES,
+        help='comma-separated frame sizes (default: {})'.format(
+            ','.join(SIZES)))
+    parser.add_argument('--dtypes', type=_split, default=DTYPES,
+        help='comma-separated input types out of {} (default: all)'.format(
+            ','.join(DTYPES)))
+    parser.add_argument('--only', type=_split, default=[],
+        help='only run benchmarks whose name contains one of these words')
+    parser.add_argument('--repeat', type=int, default=3,
+        help='number of measurements to take the best of (default: 3)')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare',
+        help='compare with the results in this JSON file')
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.dtypes, args.only, max(1, args.repeat))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'date': datetime.datetime.now().isoformat(),
+                'python': platform.python_version(),
+                'numpy': N.__version__,
+                'machine': platform.platform(),
+                'processor': platform.processor(),
+                'results': results,
+            }, f, indent=4, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f)['results'])
+
+
+if __name__ == '__main__':
+    main()
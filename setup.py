@@ -33,10 +33,12 @@ setup(
     eager_resources=['beams/icons'],
     entry_points={
         'gui_scripts': ['beams = beams.MainWindow:main'],
+        'console_scripts': ['beams-headless = beams.Headless:main'],
         'camera_plugins': [
             'apogee = beams.ApogeeCam:ApogeeCam',
             'ds = beams.DirectShow:DirectShow',
             'dummy = beams.DummyGaussian:DummyGaussian',
+            'replay = beams.ReplayCamera:ReplayCamera',
             'webcam = beams.Webcam:Webcam',
         ]
     },